@@ -6,28 +6,50 @@ from collections import deque
 from tensorflow.keras.models import Model
 import torch
 import os
+import time
 
 def Actor_network(obs_shape, num_agents, action_shape):
-    obs = Input(shape=obs_shape)
-    agent_onhot = Input(shape=num_agents)
-    old_action = Input(shape=action_shape)
-    input_embeding = Dense(32, activation="relu")(tf.concat((obs, agent_onhot, old_action), axis=-1))
+    obs = Input(shape=(obs_shape,))
+    agent_onhot = Input(shape=(num_agents,))
+    old_action = Input(shape=(action_shape,))
+    input_embeding = Dense(32, activation="relu")(Concatenate(axis=-1)([obs, agent_onhot, old_action]))
     #h = GRU(units=16, activation="relu", return_sequences=False)(input_embeding)
     pi = Dense(action_shape, activation="softmax")(input_embeding)
     model = Model(inputs=[obs, agent_onhot, old_action], outputs=pi)
     return model
 
 def Critic_network(obs_shape, action_shape, num_agents, state_shape):
-    obs = Input(shape=obs_shape)
-    state = Input(shape=state_shape)
-    agent_onhot = Input(shape=num_agents)
-    old_actions = Input(shape=action_shape*num_agents)
-    current_actions_without_agent = Input(shape=action_shape*num_agents)
-    input_embeding = Dense(32, activation="relu")(tf.concat((current_actions_without_agent, state, obs, agent_onhot, old_actions), axis=-1))
+    obs = Input(shape=(obs_shape,))
+    state = Input(shape=(state_shape,))
+    agent_onhot = Input(shape=(num_agents,))
+    old_actions = Input(shape=(action_shape*num_agents,))
+    current_actions_without_agent = Input(shape=(action_shape*num_agents,))
+    input_embeding = Dense(32, activation="relu")(Concatenate(axis=-1)([current_actions_without_agent, state, obs, agent_onhot, old_actions]))
     q = Dense(action_shape)(input_embeding)
     model = Model(inputs=[current_actions_without_agent, state, obs, agent_onhot, old_actions], outputs=q)
     return model
 
+def td_lambda_return(r, not_done, q_targets, mask, gamma, td_lambda):
+    # lambda return in one reverse scan: G_t = r_t + gamma * ((1 - lambda) * Q_{t+1} + lambda * G_{t+1})
+    # r, not_done, mask为(episode个数, max_episode_len, 1), q_targets为(episode个数, max_episode_len, n_agents)
+    # q_targets[:, t]已经是t+1时刻的Q, 最后一条有效经验之后用Q代替G_{t+1}, 即退化为1 step return
+    def step(later, elems):
+        later_return, later_mask = later
+        r_t, not_done_t, q_t, mask_t = elems
+        bootstrap = later_mask * later_return + (1 - later_mask) * q_t
+        g = (r_t + gamma * not_done_t * ((1 - td_lambda) * q_t + td_lambda * bootstrap)) * mask_t
+        return g, tf.broadcast_to(mask_t, tf.shape(g))
+
+    # 时间维放到最前面, 对每个episode和agent同时计算
+    elems = tuple(tf.transpose(x, (1, 0, 2)) for x in (r, not_done, q_targets, mask))
+    initial = (tf.zeros_like(elems[2][0]), tf.zeros_like(elems[2][0]))
+    lambda_return, _ = tf.scan(step, elems, initializer=initial, reverse=True)
+    return tf.transpose(lambda_return, (1, 0, 2))  # (episode个数, max_episode_len, n_agents)
+
+
+td_lambda_return_graph = tf.function(td_lambda_return)
+
+
 class COMA():
     def __init__(self, n_actions, n_agents, state_shape, obs_shape):
         self.n_actions = n_actions
@@ -44,70 +66,93 @@ class COMA():
         self.eval_policy_optimizer = tf.keras.optimizers.RMSprop(learning_rate=5e-4)
         self.eval_critic_optimizer = tf.keras.optimizers.RMSprop(learning_rate=5e-4)
 
-    def choose_action(self, obs, last_action, agent_num, epsilon, evaluate=False):
-        # 传入的agent_num是一个整数，代表第几个agent，现在要把他变成一个onehot向量
-        agent_onehot = np.zeros(self.n_agents)
-        agent_onehot[agent_num] = 1.
-
-        obs = tf.convert_to_tensor([obs], dtype=tf.float32)
-        agent_onehot = tf.convert_to_tensor([agent_onehot], dtype=tf.float32)
-        last_action = tf.convert_to_tensor([last_action], dtype=tf.float32)
+        # 执行阶段用的policy: 编译成图, 直接调用模型而不是每步走一次predict
+        self.agent_ids = np.eye(n_agents, dtype=np.float32)
+        self.policy_step = tf.function(self._policy_forward,
+                                       input_signature=[tf.TensorSpec((None, obs_shape), tf.float32),
+                                                        tf.TensorSpec((None, n_agents), tf.float32),
+                                                        tf.TensorSpec((None, n_actions), tf.float32)])
+        self.rng = np.random.default_rng()
+
+        # 训练阶段: critic和actor的更新都编译成图, 输入为(n_episodes, episode_len, n_agents, 具体维度)
+        # action_mask第i行把agent i自己那一段动作置0, 用来构造counterfactual的联合动作
+        self.action_mask = 1 - np.kron(np.eye(n_agents, dtype=np.float32), np.ones((1, n_actions), dtype=np.float32))
+        self.critic_buffers = None  # _critic_inputs的输出, episode数和长度不变时重复使用
+        episode_spec = lambda *dims: tf.TensorSpec((None, None) + dims, tf.float32)
+        joint_spec = episode_spec(n_agents, n_agents * n_actions)
+        self.critic_step = tf.function(self._critic_step,
+                                       input_signature=[joint_spec, joint_spec, joint_spec, joint_spec,
+                                                        tf.TensorSpec((None, None, n_agents, 1), tf.int32),
+                                                        episode_spec(1), episode_spec(1), episode_spec(1),
+                                                        episode_spec(state_shape), episode_spec(n_agents, obs_shape),
+                                                        episode_spec(state_shape), episode_spec(n_agents, obs_shape),
+                                                        episode_spec(n_agents, n_agents)])
+        self.actor_step = tf.function(self._actor_step,
+                                      input_signature=[episode_spec(n_agents, obs_shape),
+                                                       episode_spec(n_agents, n_agents),
+                                                       episode_spec(n_agents, n_actions),
+                                                       tf.TensorSpec((None, None, n_agents, 1), tf.int32),
+                                                       episode_spec(n_agents, n_actions), episode_spec(1),
+                                                       tf.TensorSpec((), tf.float32)])
+        self.grad_steps = 0
+        self.train_time = 0.0
+
+    def _policy_forward(self, obs, agent_onehot, last_action):
+        return self.eval_policy([obs, agent_onehot, last_action], training=False)
 
-        pi = self.eval_policy.predict([obs, agent_onehot, last_action])
-        if evaluate:
-            action = tf.argmax(pi[0])
-        else:
-            if np.random.rand(1) >= epsilon:  # epslion greedy
-                action = np.random.randint(0, self.n_actions)
-            else:
-                action = tf.argmax(pi[0])
+    def choose_action(self, obs, last_action, agent_num, epsilon, evaluate=False):
+        # 单个agent的版本, 内部和choose_actions走同一个编译好的policy
+        pi = self.policy_step(np.asarray([obs], dtype=np.float32), self.agent_ids[agent_num:agent_num + 1],
+                              np.asarray([last_action], dtype=np.float32)).numpy()
+        action = int(pi[0].argmax())
+        if not evaluate and np.random.rand(1) >= epsilon:  # epslion greedy
+            action = np.random.randint(0, self.n_actions)
         return action
 
+    def choose_actions(self, obs_batch, last_actions, epsilon, evaluate=False):
+        # obs_batch为(n_agents, obs_shape), last_actions为(n_agents, n_actions), 所有agent一次前向
+        pi = self.policy_step(np.asarray(obs_batch, dtype=np.float32), self.agent_ids,
+                              np.asarray(last_actions, dtype=np.float32)).numpy()
+        actions = pi.argmax(axis=1)
+        if not evaluate:  # epslion greedy, 每个agent以1-epsilon的概率随机选动作
+            explore = self.rng.random(self.n_agents) >= epsilon
+            actions = np.where(explore, self.rng.integers(0, self.n_actions, self.n_agents), actions)
+        return actions
+
 
     def learn(self, batch, max_episode_len, train_step, epsilon=0.9):  # train_step表示是第几次学习，用来控制更新target_net网络的参数
         # bacth中的每一项(n_episodes, episode_len, n_agents, 具体维度)
         # 我们采用最简化设计，n_episodes = 1， 即只采一轮数据就进行训练
-        for key in batch.keys():  # 把batch里的数据转化成tensor
-            if key == 'u':
-                batch[key] = tf.convert_to_tensor(batch[key], dtype=tf.int32)
-            else:
-                batch[key] = tf.convert_to_tensor(batch[key], dtype=tf.float32)
-        u, r, terminated = batch['u'], batch['r'], batch['terminated']
-
+        start = time.perf_counter()
         # 根据经验计算每个agent的Ｑ值,从而跟新Critic网络。然后计算各个动作执行的概率，从而计算advantage去更新Actor。
         q_values = self._train_critic(batch, max_episode_len, train_step)  # 训练critic网络，并且得到每个agent的所有动作的Ｑ值
 
-        with tf.GradientTape as tape:
-            action_prob = self._get_action_prob(batch, max_episode_len, epsilon)  # 每个agent的所有动作的概率
-            q_taken = tf.squeeze(tf.gather(q_values, dim=3, index=u), axis=3)  # 每个agent的选择的动作对应的Ｑ值
-            pi_taken = tf.squeeze(tf.gather(action_prob, dim=3, index=u), axis=3)  # 每个agent的选择的动作对应的概率
-            log_pi_taken = tf.math.log(pi_taken)
-            # 计算advantage
-            baseline = tf.stop_gradient(tf.squeeze(tf.reduce_sum(tf.multiply(q_values, action_prob), axis=3, keepdims=True), axis=3))
-            advantage = tf.stop_gradient(q_taken - baseline)
-            loss = - tf.reduce_sum(tf.multiply(advantage, log_pi_taken))
-
-            grads = tape.gradient(loss, self.eval_policy.trainable_variables)
-            self.eval_policy_optimizer.apply_gradients(zip(grads, self.eval_policy.trainable_variables))
-
-    def _get_action_prob(self, batch, max_episode_len, epsilon):
-        episode_num = batch['o'].shape[0]
-
-        action_prob = []
-        obs = batch['o']  # (n_episodes, episode_len, n_agents, n_actions)
-        agent_onhot = batch['a_onehot']  # (n_episodes, episode_len, n_agents, n_actions)
-        u_onehot = batch['u_onehot']  # (n_episodes, episode_len, n_agents, n_actions)
-        old_u_onehot = u_onehot[:, :-1]
-        padded_old_u_onehot = tf.zeros((u_onehot[0], 1, u_onehot.shape[2], u_onehot.shape[3]),
-                                       dtype=tf.int32)  # (n_episodes, episode_len, n_agents, 具体维度)
-        old_u_onehot = tf.concat((padded_old_u_onehot, old_u_onehot), axis=1)
-
-        obs = tf.reshape(tensor=obs, shape=(obs.shape[0]*obs.shape[1]*obs.shape[2], obs.shape[3]))
-        agent_onhot = tf.reshape(tensor=agent_onhot, shape=(agent_onhot.shape[0] * agent_onhot.shape[1] * agent_onhot.shape[2], agent_onhot.shape[3]))
-        old_u_onehot = tf.reshape(tensor=old_u_onehot, shape=(old_u_onehot.shape[0] * old_u_onehot.shape[1] * old_u_onehot.shape[2], old_u_onehot.shape[3]))
-        #model = Model(inputs=[obs, agent_onhot, old_action], outputs=pi)
-        action_prob = self.eval_policy.predict([obs, agent_onhot, old_u_onehot])
-        # 把该列表转化成(episode个数, max_episode_len， n_agents，n_actions)的数组
+        u_onehot = np.asarray(batch['u_onehot'], dtype=np.float32)
+        old_u_onehot = np.zeros_like(u_onehot)  # 每个agent上一个时刻的动作, 第一步补0
+        old_u_onehot[:, 1:] = u_onehot[:, :-1]
+        self.actor_step(np.asarray(batch['o'], dtype=np.float32), np.asarray(batch['a_onehot'], dtype=np.float32),
+                        old_u_onehot, np.asarray(batch['u'], dtype=np.int32), q_values, self._padding_mask(batch),
+                        tf.constant(epsilon, tf.float32))
+        self.train_time += time.perf_counter() - start
+        self.grad_steps += 2
+
+    def grad_steps_per_sec(self):
+        # critic和actor的梯度更新次数 / 花在learn里的时间
+        return self.grad_steps / self.train_time if self.train_time > 0 else 0.0
+
+    def _padding_mask(self, batch):
+        # (n_episodes, episode_len, 1), 填充的经验为0
+        if 'padded' in batch:
+            return 1 - np.asarray(batch['padded'], dtype=np.float32)
+        return np.ones(np.shape(batch['terminated']), dtype=np.float32)
+
+    def _get_action_prob(self, obs, agent_onehot, old_u_onehot, epsilon):
+        # 输入为(n_episodes, episode_len, n_agents, 具体维度), 输出每个agent所有动作的概率(n_episodes, episode_len, n_agents, n_actions)
+        shape = tf.shape(obs)
+        action_prob = self.eval_policy([tf.reshape(obs, (-1, self.obs_shape)),
+                                        tf.reshape(agent_onehot, (-1, self.n_agents)),
+                                        tf.reshape(old_u_onehot, (-1, self.n_actions))])
+        action_prob = tf.reshape(action_prob, (shape[0], shape[1], self.n_agents, self.n_actions))
 
         action_prob = ((1 - epsilon) * action_prob + tf.ones_like(action_prob) * epsilon / self.n_actions)
         # 因为上面把不能执行的动作概率置为0，所以概率和不为1了，这里要重新正则化一下。执行过程中Categorical会自己正则化。
@@ -116,146 +161,107 @@ class COMA():
 
         return action_prob
 
-
-    def _train_critic(self, batch, max_episode_len, train_step):
-        # bacth中的每一项(n_episodes, episode_len, n_agents, 具体维度)
-        # 我们采用最简化设计，n_episodes = 1， 即只采一轮数据就进行训练
-        u, r, terminated = batch['u'], batch['r'], batch['terminated']
-        u_next = u[:, 1:]
-        padded_u_next = tf.zeros((u.shape[0], 1, u.shape[2], u.shape[3]), dtype=tf.int32)#(n_episodes, episode_len, n_agents, 具体维度)
-        u_next = tf.concat((u_next, padded_u_next), axis=1)
-
-        # 得到每个agent对应的Q值，维度为(episode个数, max_episode_len， n_agents，n_actions)
-        # q_next_target为下一个状态-动作对应的target网络输出的Q值，没有包括reward
-        # model = Model(inputs=[current_actions_without_agent, state, obs, agent_onhot, old_actions], outputs=q)
-        '''
-                           o=observations.copy(),
-                           s=states.copy(),
-                           u=actions_.copy(),
-                           r=rewards.copy(),
-                           o_next=observations_next.copy(),
-                           s_next=states_next.copy(),
-                           u_onehot=actions_onehots.copy(),
-                           terminated=dones.copy(),
-                           a_onehot = agents_onehot.copy()
-        '''
-        #get eval_critic inputs
-        u_onehot = batch['u_onehot'] #(n_episodes, episode_len, n_agents, n_actions)
-        old_u_onehot = u_onehot[:, :-1]
-        padded_old_u_onehot = tf.zeros((u_onehot[0], 1, u_onehot.shape[2], u_onehot.shape[3]),
-                                 dtype=tf.int32)  # (n_episodes, episode_len, n_agents, 具体维度)
-        old_u_onehot = tf.concat((padded_old_u_onehot, old_u_onehot), axis=1)
-
-        next_u_onehot = u_onehot[:, 1:]
-        padded_next_u_onehot = tf.zeros((u_onehot[0], 1, u_onehot.shape[2], u_onehot.shape[3]),
-                                       dtype=tf.int32)  # (n_episodes, episode_len, n_agents, 具体维度)
-        next_u_onehot = tf.concat((padded_next_u_onehot, next_u_onehot), axis=1)
-
-        u_onehot = u_onehot.reshape((batch['u_onehot'].shape[0]*batch['u_onehot'].shape[1],
-                                     batch['u_onehot'].shape[2]*batch['u_onehot'].shape[3]))
-        u_onehot = np.expand_dims(u_onehot, 1).repeat(self.n_agents, axis=1)
-        #(n_episodes*episode_len, n_agents, n_agents*n_actions)
-        u_onehot_for_eval_critic = u_onehot
-        u_onehot_for_target_critic = u_onehot
-        for i in self.n_agents:
-            u_onehot_for_eval_critic[:, i, i:i+self.n_actions] = 0
-
-        old_u_onehot = old_u_onehot.reshape((batch['u_onehot'].shape[0] * batch['u_onehot'].shape[1],
-                                             batch['u_onehot'].shape[2] * batch['u_onehot'].shape[3]))
-        old_u_onehot = np.expand_dims(old_u_onehot, 1).repeat(self.n_agents, axis=1)
-        # (n_episodes*episode_len, n_agents, n_agents*n_actions)
-
-        current_actions_without_agent = u_onehot_for_eval_critic.reshape((u_onehot_for_eval_critic.shape[0]*u_onehot_for_eval_critic.shape[1], u_onehot_for_eval_critic.shape[2]))
-        state = batch['s'].reshape((batch['s'].shape[0] * batch['s'].shape[1] * batch['s'].shape[2], -1))
-        obs = batch['o'].reshape((batch['o'].shape[0] * batch['o'].shape[1] * batch['o'].shape[2], -1))
-        agent_onhot = batch['a_onehot'].reshape((batch['a_onehot'].shape[0] * batch['a_onehot'].shape[1] * batch['a_onehot'].shape[2], -1))
-        old_actions = old_u_onehot.reshape((old_u_onehot.shape[0]*old_u_onehot.shape[1], old_u_onehot.shape[2]))
-
-        # get target_critic inputs
-        next_u_onehot = next_u_onehot.reshape((batch['u_onehot'].shape[0] * batch['u_onehot'].shape[1],
-                                     batch['u_onehot'].shape[2] * batch['u_onehot'].shape[3]))
-        next_u_onehot = np.expand_dims(next_u_onehot, 1).repeat(self.n_agents, axis=1)
-        # (n_episodes*episode_len, n_agents, n_agents*n_actions)
-        for i in self.n_agents:
-            next_u_onehot[:, i, i:i + self.n_actions] = 0
-        target_current_actions_without_agent = next_u_onehot.reshape((next_u_onehot.shape[0] * next_u_onehot.shape[1], next_u_onehot.shape[2]))
-        target_state = batch['s_next'].reshape((batch['s_next'].shape[0] * batch['s_next'].shape[1] * batch['s_next'].shape[2], -1))
-        target_obs = batch['o_next'].reshape((batch['o_next'].shape[0] * batch['o_next'].shape[1] * batch['o_next'].shape[2], -1))
-        target_agent_onhot = batch['a_onehot'].reshape(
-            (batch['a_onehot'].shape[0] * batch['a_onehot'].shape[1] * batch['a_onehot'].shape[2], -1))
-        target_old_actions = u_onehot_for_target_critic.reshape((u_onehot_for_target_critic.shape[0] * u_onehot_for_target_critic.shape[1], u_onehot_for_target_critic.shape[2]))
+    def _actor_step(self, obs, agent_onehot, old_u_onehot, u, q_values, mask, epsilon):
+        with tf.GradientTape() as tape:
+            action_prob = self._get_action_prob(obs, agent_onehot, old_u_onehot, epsilon)  # 每个agent的所有动作的概率
+            q_taken = tf.gather(q_values, u, axis=3, batch_dims=3)[..., 0]  # 每个agent的选择的动作对应的Ｑ值
+            pi_taken = tf.gather(action_prob, u, axis=3, batch_dims=3)[..., 0]  # 每个agent的选择的动作对应的概率
+            log_pi_taken = tf.math.log(pi_taken)
+            # 计算advantage
+            baseline = tf.reduce_sum(q_values * action_prob, axis=3)
+            advantage = tf.stop_gradient(q_taken - baseline)
+            loss = - tf.reduce_sum(advantage * log_pi_taken * mask)
+
+        grads = tape.gradient(loss, self.eval_policy.trainable_variables)
+        self.eval_policy_optimizer.apply_gradients(zip(grads, self.eval_policy.trainable_variables))
+        return loss
+
+    def _critic_q(self, critic, actions_without_agent, state, obs, agent_onehot, old_actions):
+        # 输入为(n_episodes, episode_len, n_agents, 具体维度), state每一步只有一份, 广播给每个agent
+        shape = tf.shape(obs)
+        state = tf.broadcast_to(state[:, :, None], (shape[0], shape[1], self.n_agents, self.state_shape))
+        q = critic([tf.reshape(actions_without_agent, (-1, self.n_agents * self.n_actions)),
+                    tf.reshape(state, (-1, self.state_shape)),
+                    tf.reshape(obs, (-1, self.obs_shape)),
+                    tf.reshape(agent_onehot, (-1, self.n_agents)),
+                    tf.reshape(old_actions, (-1, self.n_agents * self.n_actions))])
+        return tf.reshape(q, (shape[0], shape[1], self.n_agents, self.n_actions))
+
+    def _critic_inputs(self, u_onehot):
+        # 一次广播乘法得到所有agent去掉自己动作后的联合动作, 结果写进复用的buffer里
+        # 返回4个(n_episodes, episode_len, n_agents, n_agents*n_actions): 当前/下一时刻去掉自己的联合动作, 上一/当前时刻的联合动作
+        n_episodes, episode_len = u_onehot.shape[:2]
+        if self.critic_buffers is None or self.critic_buffers.shape[1:3] != (n_episodes, episode_len):
+            self.critic_buffers = np.zeros((4, n_episodes, episode_len, self.n_agents, self.n_agents * self.n_actions),
+                                           dtype=np.float32)
+        actions_without_agent, next_actions_without_agent, old_actions, actions = self.critic_buffers
+        joint = np.reshape(u_onehot, (n_episodes, episode_len, 1, self.n_agents * self.n_actions))
+        np.multiply(joint, self.action_mask, out=actions_without_agent)
+        # mask不随时间变化, 下一时刻的结果直接平移得到, 最后一步补0
+        next_actions_without_agent[:, :-1] = actions_without_agent[:, 1:]
+        next_actions_without_agent[:, -1] = 0
+        actions[:] = joint
+        old_actions[:, 1:] = joint[:, :-1]  # 第一步补0
+        old_actions[:, 0] = 0
+        return self.critic_buffers
+
+    def _critic_step(self, actions_without_agent, next_actions_without_agent, old_actions, actions, u, r, terminated,
+                     mask, state, obs, state_next, obs_next, agent_onehot):
+        u_next = tf.pad(u[:, 1:], [[0, 0], [0, 1], [0, 0], [0, 0]])
+
+        # target_critic的old_actions是当前时刻的联合动作, 不去掉任何agent
+        q_next_target = self._critic_q(self.target_critic, next_actions_without_agent, state_next, obs_next,
+                                       agent_onehot, actions)
+        q_next_target = tf.gather(q_next_target, u_next, axis=3, batch_dims=3)[..., 0]  # (n_episodes, episode_len, n_agents)
+        targets = td_lambda_return(r, 1 - terminated, q_next_target, mask,
+                                   tf.constant(0.99, tf.float32), tf.constant(0.8, tf.float32))
 
         with tf.GradientTape() as tape:
-            # (n_episodes*episode_len*n_agents, n_actions)
-            q_evals = self.eval_critic.predict([current_actions_without_agent, state, obs, agent_onhot, old_actions])
-            q_next_target = self.target_critic([target_current_actions_without_agent, target_state, target_obs, target_agent_onhot, target_old_actions])
-            q_evals = q_evals.reshape((batch['o_next'].shape[0], batch['o_next'].shape[1], batch['o_next'].shape[2], self.n_actions))
-            q_next_target = q_next_target.reshape((batch['o_next'].shape[0], batch['o_next'].shape[1], batch['o_next'].shape[2], self.n_actions))
             # (n_episodes, episode_len, n_agents, n_actions)
-            q_values = q_evals.clone()  # 在函数的最后返回，用来计算advantage从而更新actor
-            # 取每个agent动作对应的Q值，并且把最后不需要的一维去掉，因为最后一维只有一个值了
-
-            q_evals = tf.squeeze(tf.gather(params=q_evals, indices=u, axis=3), axis=3)# (n_episodes, episode_len, n_agents)
-            q_next_target = tf.squeeze(tf.gather(params=q_next_target, indices=u, axis=3), axis=3)# (n_episodes, episode_len, n_agents)
-
-            targets = self.td_lambda_target(batch, max_episode_len, q_next_target)#(episode_num, max_episode_len, n_agents)
-
-            td_error = tf.stop_gradient(targets) - q_evals#(episode_num, max_episode_len, n_agents)
+            q_values = self._critic_q(self.eval_critic, actions_without_agent, state, obs, agent_onehot, old_actions)
+            # 取每个agent动作对应的Q值
+            q_evals = tf.gather(q_values, u, axis=3, batch_dims=3)[..., 0]  # (n_episodes, episode_len, n_agents)
+            td_error = tf.stop_gradient(targets) - q_evals  # (episode_num, max_episode_len, n_agents)
+            # 填充的经验不计入loss
+            loss = tf.reduce_sum(tf.square(td_error * mask))
 
-            # 不能直接用mean，因为还有许多经验是没用的，所以要求和再比真实的经验数，才是真正的均值
-            loss = tf.reduce_sum(tf.square(td_error))
-            # print('Loss is ', loss)
+        grads = tape.gradient(loss, self.eval_critic.trainable_variables)
+        self.eval_critic_optimizer.apply_gradients(zip(grads, self.eval_critic.trainable_variables))
+        return q_values  # 用来计算advantage从而更新actor
 
-            grads = tape.gradient(loss, self.eval_critic.trainable_variables)
-            self.eval_critic_optimizer.apply_gradients(zip(grads, self.eval_critic.trainable_variables))
+    def _train_critic(self, batch, max_episode_len, train_step):
+        # bacth中的每一项(n_episodes, episode_len, n_agents, 具体维度)
+        # 我们采用最简化设计，n_episodes = 1， 即只采一轮数据就进行训练
+        def per_step(key):
+            # 全局状态每一步只需要一份
+            x = np.asarray(batch[key], dtype=np.float32)
+            return x[:, :, 0] if x.ndim == 4 else x
+
+        q_values = self.critic_step(*self._critic_inputs(np.asarray(batch['u_onehot'], dtype=np.float32)),
+                                    np.asarray(batch['u'], dtype=np.int32),
+                                    np.asarray(batch['r'], dtype=np.float32),
+                                    np.asarray(batch['terminated'], dtype=np.float32), self._padding_mask(batch),
+                                    per_step('s'), np.asarray(batch['o'], dtype=np.float32), per_step('s_next'),
+                                    np.asarray(batch['o_next'], dtype=np.float32),
+                                    np.asarray(batch['a_onehot'], dtype=np.float32))
 
         if train_step > 0 and train_step % 10 == 0:
             self.target_critic.set_weights(self.eval_critic.get_weights())
         return q_values
 
-    def td_lambda_target(self, batch, max_episode_len, q_targets, gamma=0.99, td_lambda=0.8):  # 用来通过TD(lambda)计算y
+    def td_lambda_target(self, batch, max_episode_len, q_targets, gamma=0.99, td_lambda=0.8, compiled=True):  # 用来通过TD(lambda)计算y
         # batch维度为(episode个数, max_episode_len， n_agents，n_actions)
         # q_targets维度为(episode个数, max_episode_len， n_agents)
-        episode_num = batch['o'].shape[0]
-        #mask = (1 - batch["padded"].float()).repeat(1, 1, self.n_agents)  # 用来把那些填充的经验的TD-error置0，从而不让它们影响到学习
-        terminated = tf.repeat(input=1 - batch["terminated"].float(), repeats= self.n_agents, axis=2) # 用来把episode最后一条经验中的q_target置0
-        # 把reward维度从(episode个数, max_episode_len, 1)变成(episode个数, max_episode_len, n_agents)
-        r = tf.repeat(input=batch['r'], repeats= self.n_agents, axis=2)
-        # 计算n_step_return
-
-        '''
-        1. 每条经验都有若干个n_step_return，所以给一个最大的max_episode_len维度用来装n_step_return
-        最后一维,第n个数代表 n+1 step。
-        2. 因为batch中各个episode的长度不一样，所以需要用mask将多出的n-step return置为0，
-        否则的话会影响后面的lambda return。第t条经验的lambda return是和它后面的所有n-step return有关的，
-        如果没有置0，在计算td-error后再置0是来不及的
-        3. terminated用来将超出当前episode长度的q_targets和r置为0
-        '''
-        n_step_return = tf.zeros((episode_num, max_episode_len, self.n_agents, max_episode_len))
-        for transition_idx in range(max_episode_len - 1, -1, -1):
-            # 最后计算1 step return
-            n_step_return[:, transition_idx, :, 0] = (r[:, transition_idx] + gamma * q_targets[:, transition_idx]
-                                                      * terminated[:, transition_idx])
-            # 经验transition_idx上的obs有max_episode_len - transition_idx个return, 分别计算每种step return
-            # 同时要注意n step return对应的index为n-1
-            for n in range(1, max_episode_len - transition_idx):
-                # t时刻的n step return =r + gamma * (t + 1 时刻的 n-1 step return)
-                # n=1除外, 1 step return =r + gamma * (t + 1 时刻的 Q)
-                n_step_return[:, transition_idx, :, n] = (r[:, transition_idx] + gamma *
-                                                          n_step_return[:, transition_idx + 1, :, n - 1])
-            # 计算lambda return
-        '''
-        lambda_return 维度为(episode个数, max_episode_len， n_agents)，每条经验中，每个agent都有一个lambda return
-        '''
-        lambda_return = tf.zeros((episode_num, max_episode_len, self.n_agents))
-        for transition_idx in range(max_episode_len):
-            returns = tf.zeros((episode_num, self.n_agents))
-            for n in range(1, max_episode_len - transition_idx):
-                returns += pow(td_lambda, n - 1) * n_step_return[:, transition_idx, :, n - 1]
-            lambda_return[:, transition_idx] = (1 - td_lambda) * returns + \
-                                               pow(td_lambda, max_episode_len - transition_idx - 1) * \
-                                               n_step_return[:, transition_idx, :, max_episode_len - transition_idx - 1]
-        return lambda_return
+        # terminated用来把episode最后一条经验之后的bootstrap置0, padded标记的填充经验不参与计算
+        not_done = 1 - tf.cast(batch['terminated'], tf.float32)
+        r = tf.cast(batch['r'], tf.float32)
+        if 'padded' in batch:
+            mask = 1 - tf.cast(batch['padded'], tf.float32)
+        else:
+            mask = tf.ones_like(not_done)
+        returns = td_lambda_return_graph if compiled else td_lambda_return
+        return returns(r, not_done, tf.cast(q_targets, tf.float32), mask,
+                       tf.constant(gamma, tf.float32), tf.constant(td_lambda, tf.float32))
 
     def save_model(self, train_step):
         num = str(train_step // self.args.save_cycle)
@@ -264,6 +270,52 @@ class COMA():
         torch.save(self.eval_critic.state_dict(), self.model_dir + '/' + num + '_critic_params.pkl')
         torch.save(self.eval_rnn.state_dict(),  self.model_dir + '/' + num + '_rnn_params.pkl')
 
+class EpisodeBuffer():
+    def __init__(self, n_episodes, max_episode_len, n_agents, obs_shape, state_shape, n_actions):
+        # 每一项预先分配成(n_episodes, max_episode_len, n_agents, 具体维度), rollout时直接往里写
+        # o和s多留一步给最后一个obs, o_next和s_next就是错开一步的视图; 全局状态每一步只存一份, 读的时候再广播给每个agent
+        self.n_episodes = n_episodes
+        self.max_episode_len = max_episode_len
+        self.n_agents = n_agents
+        self.o = np.zeros((n_episodes, max_episode_len + 1, n_agents, obs_shape), dtype=np.float32)
+        self.s = np.zeros((n_episodes, max_episode_len + 1, state_shape), dtype=np.float32)
+        self.u = np.zeros((n_episodes, max_episode_len, n_agents, 1), dtype=np.int32)
+        self.u_onehot = np.zeros((n_episodes, max_episode_len, n_agents, n_actions), dtype=np.float32)
+        self.r = np.zeros((n_episodes, max_episode_len, 1), dtype=np.float32)
+        self.terminated = np.zeros((n_episodes, max_episode_len, 1), dtype=np.float32)
+        self.padded = np.ones((n_episodes, max_episode_len, 1), dtype=np.float32)
+        self.a_onehot = np.broadcast_to(np.eye(n_agents, dtype=np.float32), self.u_onehot.shape[:3] + (n_agents,))
+        self.actions_onehot = np.eye(n_actions, dtype=np.float32)
+
+    def store(self, episode, t, actions, reward, terminated):
+        # o[episode, t]和s[episode, t]由rollout在选动作之前直接写入
+        self.u[episode, t, :, 0] = actions
+        self.u_onehot[episode, t] = self.actions_onehot[actions]
+        self.r[episode, t] = reward
+        self.terminated[episode, t] = terminated
+
+    def end_episode(self, episode, length):
+        # o[episode, length]和s[episode, length]是最后一个obs, length之后的经验都是填充
+        self.padded[episode, :length] = 0
+        self.padded[episode, length:] = 1
+        self.r[episode, length:] = 0
+        self.terminated[episode, length:] = 0
+
+    def get_batch(self):
+        # 都是视图, 不做拷贝
+        s = self.s[:, :, None]
+        shape = (self.n_episodes, self.max_episode_len, self.n_agents, self.s.shape[-1])
+        return dict(o=self.o[:, :-1],
+                    s=np.broadcast_to(s[:, :-1], shape),
+                    u=self.u,
+                    r=self.r,
+                    o_next=self.o[:, 1:],
+                    s_next=np.broadcast_to(s[:, 1:], shape),
+                    u_onehot=self.u_onehot,
+                    terminated=self.terminated,
+                    a_onehot=self.a_onehot,
+                    padded=self.padded)
+
 from MAEnv.env_FindGoals.env_FindGoals import EnvFindGoals
 def run():
     train_steps = 0
@@ -272,81 +324,40 @@ def run():
     max_episode_len = 200
     env = EnvFindGoals()
     agents = COMA(n_actions=5, n_agents=2, state_shape=4*10*3, obs_shape=3*3*3)
+    buffer = EpisodeBuffer(n_episodes, max_episode_len, n_agents=2, obs_shape=3*3*3, state_shape=4*10*3, n_actions=5)
     for epoch in range(n_epoch):
-        episodes = []
         # 收集self.args.n_episodes个episodes
         for episode_idx in range(n_episodes):
-            observations, actions_, rewards, states, actions_onehots, agents_onehots, dones = [], [], [], [], [], [], []
-            step = 0
+            env.reset()
             episode_reward = 0
             last_action = np.zeros((2, 5))
-            for i in range(max_episode_len):
-                obs = [env.get_agt1_obs().reshape(1,-1)[0], env.get_agt2_obs().reshape(1,-1)[0]]
-                state = env.get_full_obs().reshape(1,-1).repeat(2, axis=0)
-                actions, actions_onehot = [], []
-                agents_onehot = np.zeros(2)
-                for agent_id in range(2): #n_agents
-                    # 输入当前agent上一个时刻的动作
-                    action = agents.choose_action(obs[agent_id], last_action[agent_id],
-                                                  agent_id, epsilon=0.9, evaluate=False)
-                    # 生成对应动作的0 1向量
-                    action_onehot = np.zeros(5)#n_actions
-                    action_onehot[action] = 1
-                    agent_onehot = np.zeros(2)
-                    agents_onehot[agent_id] = 1
-                    actions.append(action)
-                    actions_onehot.append(action_onehot)
-                    last_action[agent_id] = action_onehot
-                    agents_onehots.append(agent_onehot)
-
+            for step in range(max_episode_len):
+                # obs直接写进buffer里对应的位置
+                obs = buffer.o[episode_idx, step]
+                env.get_agt1_obs(out=obs[0].reshape(3, 3, 3))
+                env.get_agt2_obs(out=obs[1].reshape(3, 3, 3))
+                buffer.s[episode_idx, step] = env.get_full_obs().reshape(-1)
+                # 输入每个agent上一个时刻的动作, 所有agent一起选动作
+                actions = agents.choose_actions(obs, last_action, epsilon=0.9, evaluate=False)
                 reward, done = env.step(actions)
-                observations.append(obs)
-                states.append(state)
-                actions_.append(np.reshape(actions, [2, 1]))#[n_agents, 1]
-                actions_onehots.append(actions_onehot)
-                rewards.append([reward])
-
+                terminated = done or step == max_episode_len - 1
+                buffer.store(episode_idx, step, actions, reward, terminated)
+                last_action = buffer.u_onehot[episode_idx, step]
                 episode_reward += reward
-                step += 1
-                if done or step == max_episode_len - 1:
-                    dones.append([1])
-                else:
-                    dones.append([0])
+                if done:
+                    break
             # 处理最后一个obs
-            observations.append(obs)
-            states.append(state)
-            observations_next = observations[1:]
-            states_next = states[1:]
-            observations = observations[:-1]
-            states = states[:-1]
-
-            episode = dict(o=observations.copy(),
-                           s=states.copy(),
-                           u=actions_.copy(),
-                           r=rewards.copy(),
-                           o_next=observations_next.copy(),
-                           s_next=states_next.copy(),
-                           u_onehot=actions_onehots.copy(),
-                           terminated=dones.copy(),
-                           a_onehot = agents_onehots.copy()
-                           )
-            for key in episode.keys():
-                episode[key] = np.array([episode[key]])
-            episodes.append(episode)
+            obs = buffer.o[episode_idx, step + 1]
+            env.get_agt1_obs(out=obs[0].reshape(3, 3, 3))
+            env.get_agt2_obs(out=obs[1].reshape(3, 3, 3))
+            buffer.s[episode_idx, step + 1] = env.get_full_obs().reshape(-1)
+            buffer.end_episode(episode_idx, step + 1)
             print('epoch: {}, episode: {}, episode_reward: {}'.format(epoch, episode_idx, episode_reward))
-        # episode的每一项都是一个(1, episode_len, n_agents, 具体维度)四维数组，下面要把所有episode的的obs,action等信息拼在一起
-        episode_batch = episodes[0]
-        episodes.pop(0)
-        for episode in episodes:
-            for key in episode_batch.keys():
-                episode_batch[key] = np.concatenate((episode_batch[key], episode[key]), axis=0)
-        #episode_bacth中的每一项(n_episodes, episode_len, n_agents, 具体维度)
-        #我们采用最简化设计，n_episodes = 1， 即只采一轮数据就进行训练
-        terminated = episode_batch['terminated']
-        max_episode_len = terminated.shape[1]
-        agents.learn(batch=episode_batch, max_episode_len=max_episode_len, train_step=train_steps, epsilon=0.9)
+        #episode_bacth中的每一项(n_episodes, episode_len, n_agents, 具体维度), 较短的episode用padded标记
+        agents.learn(batch=buffer.get_batch(), max_episode_len=max_episode_len, train_step=train_steps, epsilon=0.9)
         train_steps += 1
+        print('epoch: {}, grad_steps/sec: {:.1f}'.format(epoch, agents.grad_steps_per_sec()))
 
 
 if __name__ == '__main__':
-    run()
\ No newline at end of file
+    run()
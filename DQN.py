@@ -1,9 +1,10 @@
 import tensorflow as tf
 from tensorflow.keras.layers import Conv2D, Conv3D, Dense, Flatten, Input, Dense, Concatenate
 import numpy as np
-import random
-from collections import deque
 from tensorflow.keras.models import Model
+from PER import prioritized_replay_buffer
+from actor_learner import shared_replay_buffer, weight_snapshot, async_stats, run_learner
+import multiprocessing as mp
 
 class critic_q_all(tf.keras.Model):
     def __init__(self, action_size):
@@ -34,32 +35,56 @@ def Q_network(state_shape, action_shape):
 
 
 class replay_buffer():
-    def __init__(self, buffer_len, batch_size):
-        self.buffer = deque(maxlen=buffer_len)
+    def __init__(self, buffer_len, batch_size, state_shape=(3, 3, 3), action_dim=5):
+        # preallocated ring buffer, the oldest transition is overwritten once buffer_len is reached
+        self.buffer_len = buffer_len
         self.batch_size = batch_size
+        self.states = np.zeros((buffer_len,) + tuple(state_shape), dtype=np.float32)
+        self.actions = np.zeros((buffer_len, action_dim), dtype=np.float32)
+        self.rewards = np.zeros((buffer_len, 1), dtype=np.float32)
+        self.new_states = np.zeros((buffer_len,) + tuple(state_shape), dtype=np.float32)
+        self.dones = np.zeros((buffer_len, 1), dtype=np.float32)
+        self.index = 0
+        self.size = 0
+        self.rng = np.random.default_rng()
+
+    def __len__(self):
+        return self.size
 
     def transfrom_store(self, state, action, reward, new_state, done):
-        self.buffer.append([state, action, reward, new_state, done])
+        i = self.index
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.new_states[i] = new_state
+        self.dones[i] = done
+        self.index = (i + 1) % self.buffer_len
+        self.size = min(self.size + 1, self.buffer_len)
 
     def sample(self):
-        if len(self.buffer) < self.batch_size:
-            samples = -1
-        else:
-            samples = random.sample(self.buffer, self.batch_size)
-        return samples
+        # (s, a, r, s_, done) batches drawn without replacement, -1 while fewer than batch_size are stored
+        if self.size < self.batch_size:
+            return -1
+        idx = self.rng.choice(self.size, self.batch_size, replace=False)
+        return self.states[idx], self.actions[idx], self.rewards[idx], self.new_states[idx], self.dones[idx]
 
 class DQN():
     def __init__(self, action_dim,
                  lr=5e-4,
                  epslion = 0.9,
-                 gamma = 0.995
+                 gamma = 0.995,
+                 prioritized = False
                  ):
         self.epslion = epslion
         self.gamma = gamma
         self.action_dim = action_dim
         self.q_net = Q_network(state_shape=(3,3,3), action_shape=5)
         self.q_target_net = Q_network(state_shape=(3,3,3), action_shape=5)
-        self.replay_buffer = replay_buffer(buffer_len=1000, batch_size=128)
+        self.prioritized = prioritized
+        if prioritized:
+            self.replay_buffer = prioritized_replay_buffer(buffer_len=1000, batch_size=128, state_shape=(3, 3, 3), action_shape=(action_dim,))
+        else:
+            self.replay_buffer = replay_buffer(buffer_len=1000, batch_size=128, state_shape=(3, 3, 3), action_dim=action_dim)
         self.update_target_net_weights()
         #self.lr = tf.keras.optimizers.schedules.PolynomialDecay(lr, max_episode, 1e-10, power=1.0)
         self.optimizer = tf.keras.optimizers.Adam(learning_rate=lr)
@@ -91,33 +116,26 @@ class DQN():
         samples = self.replay_buffer.sample()
         if samples == -1:
             return
+        if self.prioritized:
+            s, a, r, s_, done, weights, idx = samples
+            td_error, summaries = self.train(s, a, r, s_, done, weights)
+            self.replay_buffer.update_priorities(idx, td_error.numpy())
         else:
-            s = []
-            a = []
-            r = []
-            s_ = []
-            done = []
-            for smaple in samples:
-                s.append(smaple[0])
-                a.append(smaple[1])
-                r.append(smaple[2])
-                s_.append(smaple[3])
-                done.append(smaple[4])
-            s = tf.convert_to_tensor(s, dtype=tf.float32)
-            #a = tf.convert_to_tensor(a)
-            #r = tf.convert_to_tensor(r)
-            s_ = tf.convert_to_tensor(s_, dtype=tf.float32)
-            done = np.array(done).astype(int)
+            s, a, r, s_, done = samples
             td_error, summaries = self.train(s, a, r, s_, done)
 
-    def train(self, s, a, r, s_, done):
+    def train(self, s, a, r, s_, done, weights=None):
+        # weights: optional (batch, 1) importance-sampling weights from prioritized replay
         with tf.GradientTape() as tape:
             q = self.q_net(s)
             q_next = self.q_target_net(s_)
             q_eval = tf.reduce_sum(tf.multiply(q, a), axis=1, keepdims=True)
             q_target = tf.stop_gradient(r + self.gamma * (1 - done) * tf.reduce_max(q_next, axis=1, keepdims=True))
             td_error = q_eval - q_target
-            q_loss = tf.reduce_mean(tf.square(td_error))
+            if weights is None:
+                q_loss = tf.reduce_mean(tf.square(td_error))
+            else:
+                q_loss = tf.reduce_mean(weights * tf.square(td_error))
         grads = tape.gradient(q_loss, self.q_net.trainable_variables)
         self.optimizer.apply_gradients(zip(grads, self.q_net.trainable_variables))
         return td_error, dict([
@@ -128,32 +146,77 @@ class DQN():
         ])
 
 from MAEnv.env_FindGoals.env_FindGoals import EnvFindGoals
-if __name__ == '__main__':
-
+def actor(actor_id, snapshot, replay, stats, sync_every=50):
+    # acting only, with a CPU copy of q_net refreshed from the learner's snapshot every sync_every steps
+    tf.config.threading.set_intra_op_parallelism_threads(1)
+    np.random.seed(actor_id)
     env = EnvFindGoals()
-
     agent = DQN(action_dim=5)
-    for i_ep in range(500):
-        total_reward = 0
+    version = -1
+    while not stats.stop.value:
         env.reset()
         state1 = env.get_agt1_obs()
-
         for t in range(200):
-            #env.render()
+            if stats.actor_steps[actor_id] % sync_every == 0:
+                new_version, weights = snapshot.read(version)
+                if weights is not None:
+                    agent.q_net.set_weights(weights)
+                    version = stats.actor_versions[actor_id] = new_version
             action1 = agent.choose_action([state1])
-            reward, done = env.step([np.argmax(action1),4])
+            reward, done = env.step([np.argmax(action1), 4])
             next_state1 = env.get_agt1_obs()
-
-            agent.replay_buffer.transfrom_store(state1, action1, reward[0], next_state1, done)
-
+            replay.transfrom_store(state1, action1, reward, next_state1, done)
+            stats.actor_steps[actor_id] += 1
             state1 = next_state1
-
-            total_reward = total_reward + reward[0]
-            #agent.writer.add_scalar('live/finish_step', t+1, global_step=i_ep)
-            if t % 20 == 0:
-                agent.learn()
-            if done:
+            if done or stats.stop.value:
                 break
-        if i_ep % 5 == 0:
+
+def train_async(n_actors=4, n_updates=20000):
+    # n_actors processes step the env and fill a shared replay while this process only trains
+    ctx = mp.get_context('spawn')
+    agent = DQN(action_dim=5)
+    agent.replay_buffer = shared_replay_buffer(ctx, buffer_len=1000, batch_size=128, state_shape=(3, 3, 3), action_shape=(5,))
+    snapshot = weight_snapshot(ctx, agent.q_net.get_weights())
+    stats = async_stats(ctx, n_actors)
+
+    def learn():
+        agent.learn()
+        if stats.learner_updates.value % 100 == 0:
             agent.update_target_net_weights()
-        print("episodes {}, total_reward is {} ".format(i_ep, total_reward))
+
+    return run_learner(ctx, actor, (), n_actors, learn, agent.q_net.get_weights, snapshot, agent.replay_buffer, stats,
+                       n_updates)
+
+if __name__ == '__main__':
+    n_actors = 0  # > 0 trains with that many actor processes feeding one learner
+
+    if n_actors > 0:
+        print(train_async(n_actors))
+    else:
+        env = EnvFindGoals()
+
+        agent = DQN(action_dim=5)
+        for i_ep in range(500):
+            total_reward = 0
+            env.reset()
+            state1 = env.get_agt1_obs()
+
+            for t in range(200):
+                #env.render()
+                action1 = agent.choose_action([state1])
+                reward, done = env.step([np.argmax(action1),4])
+                next_state1 = env.get_agt1_obs()
+
+                agent.replay_buffer.transfrom_store(state1, action1, reward[0], next_state1, done)
+
+                state1 = next_state1
+
+                total_reward = total_reward + reward[0]
+                #agent.writer.add_scalar('live/finish_step', t+1, global_step=i_ep)
+                if t % 20 == 0:
+                    agent.learn()
+                if done:
+                    break
+            if i_ep % 5 == 0:
+                agent.update_target_net_weights()
+            print("episodes {}, total_reward is {} ".format(i_ep, total_reward))
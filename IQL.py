@@ -1,4 +1,5 @@
 from collections import namedtuple
+import time
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -10,6 +11,9 @@ from torch.distributions import Normal, Categorical
 from torch.utils.data.sampler import BatchSampler, SubsetRandomSampler
 #from tensorboardX import SummaryWriter
 from MAEnv.env_FindGoals.env_FindGoals import EnvFindGoals
+from PER import prioritized_replay_buffer
+from actor_learner import shared_replay_buffer, weight_snapshot, async_stats, run_learner
+import multiprocessing as mp
 import matplotlib.pyplot as plt
 
 class DQN(nn.Module):
@@ -59,12 +63,22 @@ class DQN_MODEL():
     batch_size = 128
     gamma = 0.995
     update_count = 0
+    update_time = 0.0
 
-    def __init__(self):
+    def __init__(self, prioritized=False):
         super(DQN_MODEL, self).__init__()
         self.target_net, self.act_net = DQN(in_channels=3, num_actions=5), DQN(in_channels=3, num_actions=5)
         self.update_taget_net()
-        self.memory = [None]*self.capacity
+        self.prioritized = prioritized
+        if prioritized:
+            self.memory = prioritized_replay_buffer(self.capacity, self.batch_size, state_shape=(3, 3, 3),
+                                                    action_shape=(1,), action_dtype=np.int64)
+        else:
+            # preallocated columns, written in place so update never rebuilds tensors from python objects
+            self.memory_state = torch.zeros((self.capacity, 3, 3, 3))
+            self.memory_action = torch.zeros((self.capacity, 1), dtype=torch.long)
+            self.memory_reward = torch.zeros(self.capacity)
+            self.memory_next_state = torch.zeros((self.capacity, 3, 3, 3))
         self.optimizer = optim.Adam(self.act_net.parameters(), self.learning_rate)
         self.loss_func = nn.MSELoss()
         #self.writer = SummaryWriter('./DQN/logs')
@@ -82,43 +96,146 @@ class DQN_MODEL():
         return action
 
     def store_transition(self,transition):
-        index = self.memory_count % self.capacity
-        self.memory[index] = transition
+        if self.prioritized:
+            self.memory.transfrom_store(transition.state, transition.action, transition.reward, transition.next_state, 0)
+        else:
+            index = self.memory_count % self.capacity
+            self.memory_state[index] = torch.as_tensor(transition.state)
+            self.memory_action[index] = transition.action
+            self.memory_reward[index] = transition.reward
+            self.memory_next_state[index] = torch.as_tensor(transition.next_state)
         self.memory_count += 1
         return self.memory_count >= self.capacity
 
-    def update(self):
-        if self.memory_count >= self.capacity:
-            state = torch.tensor([t.state for t in self.memory]).float()
-            action = torch.LongTensor([t.action for t in self.memory]).view(-1,1).long()
-            reward = torch.tensor([t.reward for t in self.memory]).float()
-            next_state = torch.tensor([t.next_state for t in self.memory]).float()
+    def update_prioritized(self):
+        # same number of minibatches as one pass over the memory, drawn by priority and weighted by importance sampling
+        if self.memory_count < self.capacity:
+            return
+        rewards = self.memory.rewards[:len(self.memory)]
+        reward_mean, reward_std = rewards.mean(), rewards.std()
+        for _ in range(self.capacity // self.batch_size):
+            s, a, r, s_, done, weights, idx = self.memory.sample()
+            state = torch.from_numpy(s)
+            action = torch.from_numpy(a)
+            reward = (torch.from_numpy(r) - reward_mean) / (reward_std + 1e-7)
+            with torch.no_grad():
+                target_v = reward + self.gamma * self.target_net(torch.from_numpy(s_)).max(1, keepdim=True)[0]
+            td_error = target_v - self.act_net(state).gather(1, action)
+            loss = (torch.from_numpy(weights) * td_error.pow(2)).mean()
+            self.optimizer.zero_grad()
+            loss.backward()
+            self.optimizer.step()
+            self.memory.update_priorities(idx, td_error.detach().numpy())
+            self.update_count +=1
+            if self.update_count % 100 ==0:
+                self.target_net.load_state_dict(self.act_net.state_dict())
 
+    def update(self):
+        if self.memory_count < self.capacity:
+            return
+        start = time.perf_counter()
+        if self.prioritized:
+            self.update_prioritized()
+        else:
+            reward = self.memory_reward
             reward = (reward - reward.mean()) / (reward.std() + 1e-7)
-            with torch.no_grad():
-                target_v = reward + self.gamma * self.target_net(next_state).max(1)[0]
 
             #Update...
-            for index in BatchSampler(SubsetRandomSampler(range(len(self.memory))), batch_size=self.batch_size, drop_last=False):
-                v = (self.act_net(state).gather(1, action))[index]
-                loss = self.loss_func(target_v[index].unsqueeze(1), (self.act_net(state).gather(1, action))[index])
-                self.optimizer.zero_grad()
-                loss.backward()
-                self.optimizer.step()
-                #self.writer.add_scalar('loss/value_loss', loss, self.update_count)
-                self.update_count +=1
-                if self.update_count % 100 ==0:
-                    self.target_net.load_state_dict(self.act_net.state_dict())
+            for index in BatchSampler(SubsetRandomSampler(range(self.capacity)), batch_size=self.batch_size, drop_last=False):
+                # only the sampled rows go through the networks
+                index = torch.as_tensor(index)
+                self.train_batch(self.memory_state[index], self.memory_action[index], reward[index],
+                                 self.memory_next_state[index])
+        self.update_time += time.perf_counter() - start
+
+    def train_batch(self, state, action, reward, next_state):
+        # one gradient step on a minibatch, reward already normalized
+        with torch.no_grad():
+            target_v = reward + self.gamma * self.target_net(next_state).max(1)[0]
+        v = self.act_net(state).gather(1, action)
+        loss = self.loss_func(target_v.unsqueeze(1), v)
+        self.optimizer.zero_grad()
+        loss.backward()
+        self.optimizer.step()
+        #self.writer.add_scalar('loss/value_loss', loss, self.update_count)
+        self.update_count +=1
+        if self.update_count % 100 ==0:
+            self.target_net.load_state_dict(self.act_net.state_dict())
+        return loss
+
+    def updates_per_sec(self):
+        # gradient steps per second of time spent inside update
+        return self.update_count / self.update_time if self.update_time > 0 else 0.0
 
 # Hyper-parameters
 seed = 1
 num_episodes = 2000
+prioritized = False
+n_actors = 0  # > 0 trains with that many actor processes feeding one learner
 env = EnvFindGoals()
 torch.manual_seed(seed)
 Transition = namedtuple('Transition', ['state', 'action', 'reward', 'next_state'])
-def main():
+def get_weights(net):
+    return [v.detach().numpy() for v in net.state_dict().values()]
 
+def set_weights(net, weights):
+    net.load_state_dict(dict(zip(net.state_dict().keys(), map(torch.from_numpy, weights))))
+
+def actor(actor_id, snapshot, replay, stats, sync_every=50):
+    # acting only, with a CPU copy of act_net refreshed from the learner's snapshot every sync_every steps
+    torch.set_num_threads(1)
+    np.random.seed(seed + actor_id)
+    env = EnvFindGoals()
     agent = DQN_MODEL()
+    version = -1
+    while not stats.stop.value:
+        env.reset()
+        state1 = env.get_agt1_obs()
+        state2 = env.get_agt2_obs()
+        for t in range(1000):
+            if stats.actor_steps[actor_id] % sync_every == 0:
+                new_version, weights = snapshot.read(version)
+                if weights is not None:
+                    set_weights(agent.act_net, weights)
+                    version = stats.actor_versions[actor_id] = new_version
+            with torch.no_grad():
+                action1 = agent.select_action(state1)
+                action2 = agent.select_action(state2)
+            reward, done = env.step([action1,action2])
+            next_state1 = env.get_agt1_obs()
+            next_state2 = env.get_agt2_obs()
+            replay.transfrom_store(state1, action1, reward, next_state1, done)
+            replay.transfrom_store(state2, action2, reward, next_state2, done)
+            stats.actor_steps[actor_id] += 1
+            state1 = next_state1
+            state2 = next_state2
+            if done or stats.stop.value:
+                break
+
+def train_async(n_actors=4, n_updates=20000):
+    # n_actors processes step the env and fill a shared replay while this process only trains
+    ctx = mp.get_context('spawn')
+    agent = DQN_MODEL()
+    replay = shared_replay_buffer(ctx, agent.capacity, agent.batch_size, state_shape=(3, 3, 3), action_shape=(1,),
+                                  action_dtype=np.int64)
+    snapshot = weight_snapshot(ctx, get_weights(agent.act_net))
+    stats = async_stats(ctx, n_actors)
+
+    def learn():
+        s, a, r, s_, done = replay.sample()
+        rewards = replay.rewards[:len(replay)]
+        reward = (torch.from_numpy(r[:, 0]) - rewards.mean()) / (rewards.std() + 1e-7)
+        agent.train_batch(torch.from_numpy(s), torch.from_numpy(a), reward, torch.from_numpy(s_))
+
+    return run_learner(ctx, actor, (), n_actors, learn, lambda: get_weights(agent.act_net), snapshot, replay, stats,
+                       n_updates)
+
+def main():
+    if n_actors > 0:
+        print(train_async(n_actors))
+        return
+
+    agent = DQN_MODEL(prioritized=prioritized)
     for i_ep in range(num_episodes):
         total_reward = 0
         env.reset()
@@ -143,7 +260,7 @@ def main():
             if done:
                 break
         agent.update_taget_net()
-        print("episodes {}, total_reward is {} ".format(i_ep, total_reward))
+        print("episodes {}, total_reward is {}, updates/sec {:.1f} ".format(i_ep, total_reward, agent.updates_per_sec()))
 
 
 
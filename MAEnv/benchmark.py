@@ -0,0 +1,228 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import time
+
+# headless: no display and no GPU are needed, matplotlib draws to memory if an env imports it
+os.environ.setdefault('MPLBACKEND', 'Agg')
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '')
+
+import random
+import numpy as np
+
+ENV_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def actions(n_agents, n_actions):
+    return lambda env, rng: env.step([int(a) for a in rng.integers(0, n_actions, n_agents)])
+
+
+def drones_step(env, rng):
+    return env.step([int(a) for a in rng.integers(0, 5, env.human_num)],
+                    [int(a) for a in rng.integers(0, 5, env.drone_num)])
+
+
+def soccer_step(env, rng):
+    return env.step([int(a) for a in rng.integers(0, 5, 6)], (20 * (rng.random((6, 2)) - 0.5)).tolist(),
+                    (20 * rng.random(6)).tolist())
+
+
+def rescue_step(env, rng):
+    # step returns (rewards, positions), there is no done flag to hand back
+    action_list = np.zeros((2, 4))
+    action_list[:, :2] = rng.random((2, 2)) - 0.5
+    action_list[:, 2] = 20 * (rng.random(2) - 0.5)
+    env.step(action_list)
+
+
+def mas_step(env, rng):
+    return env.move(int(rng.integers(8)), int(rng.integers(8)))
+
+
+# name: (directory, module, class, constructor args, step(env, rng), obs methods, reset(env))
+BENCHMARKS = {
+    'FindGoals': ('env_FindGoals', 'env_FindGoals', 'EnvFindGoals', (), actions(2, 5),
+                  ['get_agt1_obs', 'get_obs', 'get_full_obs'], lambda env: env.reset()),
+    'CatchPigs': ('env_CatchPigs', 'env_CatchPigs', 'EnvCatchPigs', (7, True), actions(2, 5),
+                  ['get_agt1_obs', 'get_obs', 'get_full_obs'], lambda env: env.reset()),
+    'SingleCatchPigs': ('env_SingleCatchPigs', 'env_SingleCatchPigs', 'EnvSingleCatchPigs', (7,),
+                        lambda env, rng: env.step(int(rng.integers(5))), ['get_obs', 'get_global_obs'],
+                        lambda env: env.reset()),
+    'Cleaner': ('env_Cleaner', 'env_Cleaner', 'EnvCleaner', (2, 13, 0), actions(2, 4), ['get_global_obs'],
+                lambda env: env.reset()),
+    'Drones': ('env_Drones', 'env_Drones', 'EnvDrones', (50, 4, 10, 30, 5), drones_step,
+               ['get_all_drone_obs', 'get_joint_obs', 'get_full_obs'], lambda env: env.rand_reset_drone_pos()),
+    'FindTreasure': ('env_FindTreasure', 'env_FindTreasure', 'EnvFindTreasure', (7,), actions(2, 4),
+                     ['get_obs', 'get_global_obs'], lambda env: env.reset()),
+    'FireFighter': ('env_FireFighter', 'env_FireFighter', 'EnvFireFighter', (4,), actions(3, 2), ['get_obs'],
+                    lambda env: env.reset()),
+    'GoTogether': ('env_GoTogether', 'env_GoTogether', 'EnvGoTogether', (15,), actions(2, 4), ['get_global_obs'],
+                   lambda env: env.reset()),
+    'MoveBox': ('env_MoveBox', 'env_MoveBox', 'EnvMoveBox', (), actions(2, 4), ['get_obs', 'get_global_obs'],
+                lambda env: env.reset()),
+    'OppositeV2': ('env_Opposite', 'env_OppositeV2', 'EnvOppositeV2', (7,), actions(4, 5), ['get_global_obs'],
+                   lambda env: env.reset()),
+    'Soccer': ('env_Soccer', 'env_Soccer', 'EnvSoccer', (), soccer_step, ['get_global_obs'],
+               lambda env: env.reset_game()),
+    'Warehouse': ('env_Warehouse', 'env_Warehouse', 'EnvWarehouse', (4,), actions(4, 4), ['get_global_obs'],
+                  lambda env: env.reset(4)),
+    'Rescue': (os.path.join('env_Rescue', 'Python3'), 'env_rescue', 'EnvRescue', (13, 2, 4, 0), rescue_step,
+               ['get_obs', 'get_all_agent_obs', 'get_global_obs', 'get_real_obs'], lambda env: env.reset()),
+    'MAS_Checkers': ('MAS_enviroment', 'MAS_Checkers', 'GameEnv', (), mas_step, ['render_env'],
+                     lambda env: env.reset()),
+    'MAS_Fetch': ('MAS_enviroment', 'MAS_Fetch', 'GameEnv', (), mas_step, ['render_env'], lambda env: env.reset()),
+    'MAS_Gathering': ('MAS_enviroment', 'MAS_Gathering', 'GameEnv', (), mas_step, ['render_env'],
+                      lambda env: env.reset()),
+    'MAS_Switch': ('MAS_enviroment', 'MAS_Switch', 'GameEnv', (), mas_step, ['render_env'], lambda env: env.reset()),
+}
+
+
+def latency(samples):
+    # per-call latency in microseconds
+    samples = np.asarray(samples, dtype=np.float64) * 1e6
+    return dict(calls=len(samples), mean_us=float(samples.mean()), p50_us=float(np.percentile(samples, 50)),
+                p90_us=float(np.percentile(samples, 90)), p99_us=float(np.percentile(samples, 99)),
+                max_us=float(samples.max()))
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def run_one(name, n_steps, seed, reset_every):
+    # fixed-seed random-action rollout of one env, run in its own process so peak RSS and import time are its own
+    # the working directory is the env's own, some of them load their assets from it
+    directory, module, cls, args, step, obs_methods, reset = BENCHMARKS[name]
+    sys.path.insert(0, os.path.join(ENV_ROOT, directory))
+    random.seed(seed)
+    np.random.seed(seed)
+    rng = np.random.default_rng(seed)
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # envs print while they build and step, keep that out of the JSON on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        env_module, import_time = timed(__import__, module)
+        env, init_time = timed(getattr(env_module, cls), *args)
+        times = dict(step=[], reset=[])
+        times.update((method, []) for method in obs_methods)
+        rollout_start = time.perf_counter()
+        for i in range(n_steps):
+            out, t = timed(step, env, rng)
+            times['step'].append(t)
+            for method in obs_methods:
+                times[method].append(timed(getattr(env, method))[1])
+            done = isinstance(out, tuple) and len(out) == 2 and bool(np.all(out[1]))
+            if done or (i + 1) % reset_every == 0:
+                times['reset'].append(timed(reset, env)[1])
+        rollout_time = time.perf_counter() - rollout_start
+
+    return dict(steps=n_steps,
+                steps_per_sec=n_steps / sum(times['step']),
+                rollout_steps_per_sec=n_steps / rollout_time,
+                import_ms=import_time * 1e3,
+                init_ms=init_time * 1e3,
+                latency=dict((key, latency(value)) for key, value in times.items() if value),
+                peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                rollout_rss_growth_mb=(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start) / 1024)
+
+
+IMPORT_PROBE = """
+import resource, sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+__import__(sys.argv[2])
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def import_cost(name, repeats=5):
+    # startup cost a fresh worker pays for importing one env module: best wall time and the resulting RSS
+    directory, module = BENCHMARKS[name][:2]
+    path = os.path.join(ENV_ROOT, directory)
+    samples = []
+    for _ in range(repeats):
+        proc = subprocess.run([sys.executable, '-c', IMPORT_PROBE, path, module], capture_output=True, text=True,
+                              cwd=path)
+        if proc.returncode != 0:
+            return None
+        seconds, rss = proc.stdout.strip().splitlines()[-1].split()
+        samples.append((float(seconds), int(rss)))
+    seconds, rss = min(samples)
+    return dict(import_ms=seconds * 1e3, rss_mb=rss / 1024)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ENV_ROOT, stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless random-rollout benchmark of the MAEnv environments.')
+    parser.add_argument('envs', nargs='*', help='environments to run, all of %s by default' % ', '.join(BENCHMARKS))
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--reset-every', type=int, default=200)
+    parser.add_argument('--out', default='benchmark.json', help='JSON file the results are written to')
+    parser.add_argument('--imports', action='store_true',
+                        help='only measure the import time and RSS of each env module in a fresh interpreter')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.imports:
+        results = {}
+        for name in args.envs or list(BENCHMARKS):
+            results[name] = import_cost(name)
+            if results[name] is None:
+                print('%-16s skipped' % name)
+            else:
+                print('%-16s import %8.1f ms  RSS %6.1f MB' % (name, results[name]['import_ms'],
+                                                              results[name]['rss_mb']))
+        with open(args.out, 'w') as f:
+            json.dump(dict(meta=dict(commit=git_commit(), python=platform.python_version()), imports=results), f,
+                      indent=2)
+        print('results written to', args.out)
+        return
+
+    if args.worker:
+        print(json.dumps(run_one(args.worker, args.steps, args.seed, args.reset_every)))
+        return
+
+    results = {}
+    for name in args.envs or list(BENCHMARKS):
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', name, '--steps', str(args.steps),
+                               '--seed', str(args.seed), '--reset-every', str(args.reset_every)],
+                              capture_output=True, text=True, cwd=os.path.join(ENV_ROOT, BENCHMARKS[name][0]))
+        if proc.returncode == 0:
+            results[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+            print('%-16s %12.0f steps/s  step p50 %8.1f us  p99 %8.1f us  peak RSS %6.1f MB' % (
+                name, results[name]['steps_per_sec'], results[name]['latency']['step']['p50_us'],
+                results[name]['latency']['step']['p99_us'], results[name]['peak_rss_mb']))
+        else:
+            # missing optional dependencies (scipy, the Rescue C extension, ...) are recorded, not fatal
+            errors = re.findall(r'^[A-Za-z_][\w.]*(?:Error|Exception)\b.*$', proc.stderr, re.M)
+            results[name] = dict(error=errors[-1] if errors else 'exit code %d' % proc.returncode)
+            print('%-16s skipped: %s' % (name, results[name]['error']))
+
+    report = dict(meta=dict(commit=git_commit(), python=platform.python_version(), numpy=np.__version__,
+                            machine=platform.machine(), steps=args.steps, seed=args.seed,
+                            reset_every=args.reset_every, time=time.strftime('%Y-%m-%dT%H:%M:%S')),
+                  results=results)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('results written to', args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,70 +1,89 @@
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
 import random
-import cv2
+
+HEADLESS = os.environ.get('MAENV_HEADLESS', '0') != '0'
+
+
+def _catch_pigs_tiles():
+    # 3x3 sprite per orientation, shared by hunters and pigs
+    sprites = np.zeros((4, 3, 3), dtype=bool)
+    sprites[0][[0, 1, 1, 1, 2], [0, 0, 1, 2, 0]] = True
+    sprites[1][[0, 0, 0, 1, 2], [0, 1, 2, 1, 1]] = True
+    sprites[2][[0, 1, 1, 1, 2], [2, 0, 1, 2, 2]] = True
+    sprites[3][[0, 1, 2, 2, 2], [1, 1, 0, 1, 2]] = True
+    # cell codes: 0 free, 1 block, 2 + 4 * color + orientation with colors red, blue (hunters) and green (pigs)
+    tiles = np.ones((14, 3, 3, 3))
+    tiles[1] = 0.0
+    for color, rgb in enumerate([[1.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.0, 1.0, 0.0]]):
+        for ori in range(4):
+            tiles[2 + 4 * color + ori][sprites[ori]] = rgb
+    return tiles
+
+
+def _catch_pigs_fog():
+    # area behind an entity facing each orientation, greyed out in its 15x15 observation
+    fog = np.zeros((4, 15, 15), dtype=bool)
+    fog[0][:, 9:] = True
+    fog[1][9:, :] = True
+    fog[2][:, :6] = True
+    fog[3][:6, :] = True
+    return fog
+
+
+CATCH_PIGS_TILES = _catch_pigs_tiles()
+CATCH_PIGS_FOG = _catch_pigs_fog()
+# offsets of a 5x5 observation cell [row, col] from the viewer: dx = col - 2, dy = 2 - row
+CATCH_PIGS_VIEW_COLS = np.tile(np.arange(-2, 3), (5, 1))
+CATCH_PIGS_VIEW_ROWS = CATCH_PIGS_VIEW_COLS.T[::-1].copy()
+# orientation -> step taken by a move action: 0 west, 1 north, 2 east, 3 south
+CATCH_PIGS_HEADINGS = np.array([[-1, 0], [0, 1], [1, 0], [0, -1]])
+# action -> new orientation, indexed [action, orientation]: turn left, turn right, move, catch, wait
+CATCH_PIGS_TURNS = np.array([[3, 0, 1, 2],
+                             [1, 2, 3, 0],
+                             [0, 1, 2, 3],
+                             [0, 1, 2, 3],
+                             [0, 1, 2, 3]])
+CATCH_PIGS_HUNTER = 0
+CATCH_PIGS_PIG = 1
+# a pig is caught when this many hunters catch it in the same step
+CATCH_PIGS_CATCHERS = 2
+# cv2 (BGR) colors used by render, same order as the tile colors
+CATCH_PIGS_RENDER_COLORS = [(0, 0, 255), (255, 0, 0), (0, 255, 0)]
+
 
 class EnvCatchPigs(object):
-    def __init__(self, size, if_PO):
+    def __init__(self, size, if_PO, n_agents=2, n_pigs=1):
         assert self.check_size(size)
         self.if_PO = if_PO
         self.map_size = size
-        self.occupancy = np.zeros((self.map_size, self.map_size))
-        for i in range(self.map_size):
-            self.occupancy[0][i] = 1
-            self.occupancy[1][i] = 1
-            self.occupancy[self.map_size - 2][i] = 1
-            self.occupancy[self.map_size - 1][i] = 1
-            self.occupancy[i][0] = 1
-            self.occupancy[i][1] = 1
-            self.occupancy[i][self.map_size - 2] = 1
-            self.occupancy[i][self.map_size - 1] = 1
-
-        for i in range(3, self.map_size - 3, 2):
-            for j in range(3, self.map_size - 3, 2):
-                self.occupancy[i][j] = 1
+        self.n_agents = n_agents
+        self.n_pigs = n_pigs
+        self.n_entities = n_agents + n_pigs
 
         self.raw_occupancy = np.zeros((self.map_size, self.map_size))
-        for i in range(self.map_size):
-            self.raw_occupancy[0][i] = 1
-            self.raw_occupancy[1][i] = 1
-            self.raw_occupancy[self.map_size - 2][i] = 1
-            self.raw_occupancy[self.map_size - 1][i] = 1
-            self.raw_occupancy[i][0] = 1
-            self.raw_occupancy[i][1] = 1
-            self.raw_occupancy[i][self.map_size - 2] = 1
-            self.raw_occupancy[i][self.map_size - 1] = 1
-
-        for i in range(3, self.map_size - 3, 2):
-            for j in range(3, self.map_size - 3, 2):
-                self.raw_occupancy[i][j] = 1
-
-        # initialize agent 1
-        self.agt1_pos = [random.randint(2, self.map_size - 3), random.randint(2, self.map_size - 3)]
-        while self.occupancy[self.agt1_pos[0]][self.agt1_pos[1]] == 1:
-            self.agt1_pos = [random.randint(2, self.map_size - 3), random.randint(2, self.map_size - 3)]
-        self.occupancy[self.agt1_pos[0]][self.agt1_pos[1]] = 1
-
-        self.agt1_ori = random.randint(0, 3)
-
-        # initialize agent 2
-        self.agt2_pos = [random.randint(2, self.map_size - 3), random.randint(2, self.map_size - 3)]
-        while self.occupancy[self.agt2_pos[0]][self.agt2_pos[1]] == 1:
-            self.agt2_pos = [random.randint(2, self.map_size - 3), random.randint(2, self.map_size - 3)]
-        self.occupancy[self.agt2_pos[0]][self.agt2_pos[1]] = 1
-
-        self.agt2_ori = random.randint(0, 3)
-
-        # initialize pig
-        self.pig_pos = [random.randint(2, self.map_size-3), random.randint(2, self.map_size-3)]
-        while self.occupancy[self.pig_pos[0]][self.pig_pos[1]] == 1:
-            self.pig_pos = [random.randint(2, self.map_size-3), random.randint(2, self.map_size-3)]
-        self.occupancy[self.pig_pos[0]][self.pig_pos[1]] = 1
-
-        self.pig_ori = random.randint(0, 3)
-
-        self.if_agt1_catches = False
-        self.if_agt2_catches = False
+        self.raw_occupancy[:2, :] = 1
+        self.raw_occupancy[-2:, :] = 1
+        self.raw_occupancy[:, :2] = 1
+        self.raw_occupancy[:, -2:] = 1
+        self.raw_occupancy[3:self.map_size - 3:2, 3:self.map_size - 3:2] = 1
+        # static walls padded by two cells so any 5x5 window can be sliced without bound checks
+        self.padded_raw_occupancy = np.pad(self.raw_occupancy, 2, constant_values=1).astype(np.int64)
+
+        # entity arrays, hunters first and pigs last: (E, 2) positions, (E,) orientations and kinds
+        self.kind = np.array([CATCH_PIGS_HUNTER] * n_agents + [CATCH_PIGS_PIG] * n_pigs)
+        self.positions = np.zeros((self.n_entities, 2), dtype=np.int64)
+        self.orientations = np.zeros(self.n_entities, dtype=np.int64)
+        # hunters alternate red / blue so agent 1 is red and agent 2 blue, pigs are green
+        self.colors = np.where(self.kind == CATCH_PIGS_PIG, 2, np.arange(self.n_entities) % 2)
+        # earlier[i, j] is True when entity j acts before entity i within a step
+        self.earlier = np.tri(self.n_entities, k=-1, dtype=bool)
+        self.later = self.earlier.T
+        # cells are also addressed by flat index x * map_size + y
+        self.cell_stride = np.array([self.map_size, 1])
+        self.heading_cells = CATCH_PIGS_HEADINGS @ self.cell_stride
+        self.raw_flat = self.raw_occupancy.reshape(-1)
+        self.reset()
 
     def check_size(self, size):
         print("size of map should be an odd integer no smaller than 7")
@@ -74,759 +93,147 @@ class EnvCatchPigs(object):
             return False
 
     def reset(self):
-        self.occupancy = np.zeros((self.map_size, self.map_size))
-        for i in range(self.map_size):
-            self.occupancy[0][i] = 1
-            self.occupancy[1][i] = 1
-            self.occupancy[self.map_size - 2][i] = 1
-            self.occupancy[self.map_size - 1][i] = 1
-            self.occupancy[i][0] = 1
-            self.occupancy[i][1] = 1
-            self.occupancy[i][self.map_size - 2] = 1
-            self.occupancy[i][self.map_size - 1] = 1
-
-        for i in range(3, self.map_size - 3, 2):
-            for j in range(3, self.map_size - 3, 2):
-                self.occupancy[i][j] = 1
-
-        # initialize agent 1
-        self.agt1_pos = [random.randint(2, self.map_size-3), random.randint(2, self.map_size-3)]
-        while self.occupancy[self.agt1_pos[0]][self.agt1_pos[1]] == 1:
-            self.agt1_pos = [random.randint(2, self.map_size-3), random.randint(2, self.map_size-3)]
-        self.occupancy[self.agt1_pos[0]][self.agt1_pos[1]] = 1
-
-        self.agt1_ori = random.randint(0, 3)
-
-        # initialize agent 2
-        self.agt2_pos = [random.randint(2, self.map_size-3), random.randint(2, self.map_size-3)]
-        while self.occupancy[self.agt2_pos[0]][self.agt2_pos[1]] == 1:
-            self.agt2_pos = [random.randint(2, self.map_size-3), random.randint(2, self.map_size-3)]
-        self.occupancy[self.agt2_pos[0]][self.agt2_pos[1]] = 1
-
-        self.agt2_ori = random.randint(0, 3)
-
-        # initialize pig
-        self.pig_pos = [random.randint(2, self.map_size-3), random.randint(2, self.map_size-3)]
-        while self.occupancy[self.pig_pos[0]][self.pig_pos[1]] == 1:
-            self.pig_pos = [random.randint(2, self.map_size-3), random.randint(2, self.map_size-3)]
-        self.occupancy[self.pig_pos[0]][self.pig_pos[1]] = 1
-
-        self.pig_ori = random.randint(0, 3)
-
-        self.if_agt1_catches = False
-        self.if_agt2_catches = False
+        self.occupancy = self.raw_occupancy.copy()
+        for k in range(self.n_entities):
+            pos = [random.randint(2, self.map_size - 3), random.randint(2, self.map_size - 3)]
+            while self.occupancy[pos[0]][pos[1]] == 1:
+                pos = [random.randint(2, self.map_size - 3), random.randint(2, self.map_size - 3)]
+            self.occupancy[pos[0]][pos[1]] = 1
+            self.positions[k] = pos
+            self.orientations[k] = random.randint(0, 3)
+
+    # views of the original two hunters and pig
+    @property
+    def agt1_pos(self):
+        return self.positions[0].tolist()
+
+    @property
+    def agt2_pos(self):
+        return self.positions[1].tolist()
+
+    @property
+    def pig_pos(self):
+        return self.positions[self.n_agents].tolist()
+
+    @property
+    def agt1_ori(self):
+        return int(self.orientations[0])
+
+    @property
+    def agt2_ori(self):
+        return int(self.orientations[1])
+
+    @property
+    def pig_ori(self):
+        return int(self.orientations[self.n_agents])
 
     def list_add(self, a, b):
         c = [a[i] + b[i] for i in range(min(len(a), len(b)))]
         return c
 
-    def paint_block(self, obs, i, j):
-        new_obs = obs
-        for row in range(3):
-            for col in range(3):
-                new_obs[i * 3 + row, j * 3 + col, 0] = 0.0
-                new_obs[i * 3 + row, j * 3 + col, 1] = 0.0
-                new_obs[i * 3 + row, j * 3 + col, 2] = 0.0
-        return new_obs
-
-    def paint_agt1(self, obs, i, j, ori):
-        new_obs = obs
-        if ori == 0:
-            new_obs[i * 3, j * 3, 0] = 1.0
-            new_obs[i * 3, j * 3, 1] = 0.0
-            new_obs[i * 3, j * 3, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3, 0] = 1.0
-            new_obs[i * 3 + 1, j * 3, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 0] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 2, 0] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 2, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 2, 2] = 0.0
-            new_obs[i * 3 + 2, j * 3, 0] = 1.0
-            new_obs[i * 3 + 2, j * 3, 1] = 0.0
-            new_obs[i * 3 + 2, j * 3, 2] = 0.0
-        elif ori == 1:
-            new_obs[i * 3, j * 3, 0] = 1.0
-            new_obs[i * 3, j * 3, 1] = 0.0
-            new_obs[i * 3, j * 3, 2] = 0.0
-            new_obs[i * 3, j * 3 + 1, 0] = 1.0
-            new_obs[i * 3, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3, j * 3 + 1, 2] = 0.0
-            new_obs[i * 3, j * 3 + 2, 0] = 1.0
-            new_obs[i * 3, j * 3 + 2, 1] = 0.0
-            new_obs[i * 3, j * 3 + 2, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 0] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 2] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 1, 0] = 1.0
-            new_obs[i * 3 + 2, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 1, 2] = 0.0
-        elif ori == 2:
-            new_obs[i * 3, j * 3 + 2, 0] = 1.0
-            new_obs[i * 3, j * 3 + 2, 1] = 0.0
-            new_obs[i * 3, j * 3 + 2, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3, 0] = 1.0
-            new_obs[i * 3 + 1, j * 3, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 0] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 2, 0] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 2, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 2, 2] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 2, 0] = 1.0
-            new_obs[i * 3 + 2, j * 3 + 2, 1] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 2, 2] = 0.0
-        elif ori == 3:
-            new_obs[i * 3, j * 3 + 1, 0] = 1.0
-            new_obs[i * 3, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3, j * 3 + 1, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 0] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 2] = 0.0
-            new_obs[i * 3 + 2, j * 3, 0] = 1.0
-            new_obs[i * 3 + 2, j * 3, 1] = 0.0
-            new_obs[i * 3 + 2, j * 3, 2] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 1, 0] = 1.0
-            new_obs[i * 3 + 2, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 1, 2] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 2, 0] = 1.0
-            new_obs[i * 3 + 2, j * 3 + 2, 1] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 2, 2] = 0.0
-        return new_obs
-
-    def paint_agt2(self, obs, i, j, ori):
-        new_obs = obs
-        if ori == 0:
-            new_obs[i * 3, j * 3, 0] = 0.0
-            new_obs[i * 3, j * 3, 1] = 0.0
-            new_obs[i * 3, j * 3, 2] = 1.0
-            new_obs[i * 3 + 1, j * 3, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3, 2] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 2] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 2, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 2, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 2, 2] = 1.0
-            new_obs[i * 3 + 2, j * 3, 0] = 0.0
-            new_obs[i * 3 + 2, j * 3, 1] = 0.0
-            new_obs[i * 3 + 2, j * 3, 2] = 1.0
-        elif ori == 1:
-            new_obs[i * 3, j * 3, 0] = 0.0
-            new_obs[i * 3, j * 3, 1] = 0.0
-            new_obs[i * 3, j * 3, 2] = 1.0
-            new_obs[i * 3, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3, j * 3 + 1, 2] = 1.0
-            new_obs[i * 3, j * 3 + 2, 0] = 0.0
-            new_obs[i * 3, j * 3 + 2, 1] = 0.0
-            new_obs[i * 3, j * 3 + 2, 2] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 2] = 1.0
-            new_obs[i * 3 + 2, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 1, 2] = 1.0
-        elif ori == 2:
-            new_obs[i * 3, j * 3 + 2, 0] = 0.0
-            new_obs[i * 3, j * 3 + 2, 1] = 0.0
-            new_obs[i * 3, j * 3 + 2, 2] = 1.0
-            new_obs[i * 3 + 1, j * 3, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3, 2] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 2] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 2, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 2, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 2, 2] = 1.0
-            new_obs[i * 3 + 2, j * 3 + 2, 0] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 2, 1] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 2, 2] = 1.0
-        elif ori == 3:
-            new_obs[i * 3, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3, j * 3 + 1, 2] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 2] = 1.0
-            new_obs[i * 3 + 2, j * 3, 0] = 0.0
-            new_obs[i * 3 + 2, j * 3, 1] = 0.0
-            new_obs[i * 3 + 2, j * 3, 2] = 1.0
-            new_obs[i * 3 + 2, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 1, 1] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 1, 2] = 1.0
-            new_obs[i * 3 + 2, j * 3 + 2, 0] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 2, 1] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 2, 2] = 1.0
-        return new_obs
-
-    def paint_pig(self, obs, i, j, ori):
-        new_obs = obs
-        if ori == 0:
-            new_obs[i * 3, j * 3, 0] = 0.0
-            new_obs[i * 3, j * 3, 1] = 1.0
-            new_obs[i * 3, j * 3, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3, 1] = 1.0
-            new_obs[i * 3 + 1, j * 3, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 1] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 1, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 2, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 2, 1] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 2, 2] = 0.0
-            new_obs[i * 3 + 2, j * 3, 0] = 0.0
-            new_obs[i * 3 + 2, j * 3, 1] = 1.0
-            new_obs[i * 3 + 2, j * 3, 2] = 0.0
-        elif ori == 1:
-            new_obs[i * 3, j * 3, 0] = 0.0
-            new_obs[i * 3, j * 3, 1] = 1.0
-            new_obs[i * 3, j * 3, 2] = 0.0
-            new_obs[i * 3, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3, j * 3 + 1, 1] = 1.0
-            new_obs[i * 3, j * 3 + 1, 2] = 0.0
-            new_obs[i * 3, j * 3 + 2, 0] = 0.0
-            new_obs[i * 3, j * 3 + 2, 1] = 1.0
-            new_obs[i * 3, j * 3 + 2, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 1] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 1, 2] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 1, 1] = 1.0
-            new_obs[i * 3 + 2, j * 3 + 1, 2] = 0.0
-        elif ori == 2:
-            new_obs[i * 3, j * 3 + 2, 0] = 0.0
-            new_obs[i * 3, j * 3 + 2, 1] = 1.0
-            new_obs[i * 3, j * 3 + 2, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3, 1] = 1.0
-            new_obs[i * 3 + 1, j * 3, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 1] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 1, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 2, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 2, 1] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 2, 2] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 2, 0] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 2, 1] = 1.0
-            new_obs[i * 3 + 2, j * 3 + 2, 2] = 0.0
-        elif ori == 3:
-            new_obs[i * 3, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3, j * 3 + 1, 1] = 1.0
-            new_obs[i * 3, j * 3 + 1, 2] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3 + 1, j * 3 + 1, 1] = 1.0
-            new_obs[i * 3 + 1, j * 3 + 1, 2] = 0.0
-            new_obs[i * 3 + 2, j * 3, 0] = 0.0
-            new_obs[i * 3 + 2, j * 3, 1] = 1.0
-            new_obs[i * 3 + 2, j * 3, 2] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 1, 0] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 1, 1] = 1.0
-            new_obs[i * 3 + 2, j * 3 + 1, 2] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 2, 0] = 0.0
-            new_obs[i * 3 + 2, j * 3 + 2, 1] = 1.0
-            new_obs[i * 3 + 2, j * 3 + 2, 2] = 0.0
-        return new_obs
+    def get_po_obs(self, viewers):
+        # partial observations of the entities in viewers, (len(viewers), 15, 15, 3)
+        pos = self.positions
+        ori = self.orientations
+        viewers = np.asarray(viewers)
+        n = len(viewers)
+        view_pos = pos[viewers]
+
+        # 5x5 cell codes around each viewer, row 0 is the top (y + 2), column 0 the left (x - 2)
+        xs = view_pos[:, 0, None, None] + CATCH_PIGS_VIEW_COLS + 2
+        ys = view_pos[:, 1, None, None] + CATCH_PIGS_VIEW_ROWS + 2
+        code = self.padded_raw_occupancy[xs, ys]
+
+        # stamp every entity inside each window, the viewer itself lands in the centre
+        rel = pos[None, :, :] - view_pos[:, None, :]
+        inside = np.all(np.abs(rel) <= 2, axis=2)
+        v_idx, e_idx = np.nonzero(inside)
+        code[v_idx, 2 - rel[v_idx, e_idx, 1], 2 + rel[v_idx, e_idx, 0]] = 2 + 4 * self.colors[e_idx] + ori[e_idx]
+
+        # upsample each cell into its 3x3 tile, then cover what lies behind the viewer with fog
+        obs = CATCH_PIGS_TILES[code].transpose(0, 1, 3, 2, 4, 5).reshape(n, 15, 15, 3)
+        obs[CATCH_PIGS_FOG[ori[viewers]]] = 0.5
+        return obs
 
-    def get_agt1_obs(self):
-        obs = []
+    def get_all_obs(self):
+        # observations of every hunter followed by every pig, (n_agents + n_pigs, 15, 15, 3)
         if self.if_PO == False:
-            obs = self.get_global_obs()
-        else:
-            obs = np.zeros((5*3, 5*3, 3))
-            for i in range(5*3):
-                for j in range(5*3):
-                    obs[i, j, 0] = 1.0
-                    obs[i, j, 1] = 1.0
-                    obs[i, j, 2] = 1.0
-            for k in range(5):
-                if self.raw_occupancy[self.agt1_pos[0] - 2][self.agt1_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4-k, 0)
-                if self.raw_occupancy[self.agt1_pos[0] - 1][self.agt1_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4-k, 1)
-                if self.raw_occupancy[self.agt1_pos[0]][self.agt1_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4-k, 2)
-                if self.raw_occupancy[self.agt1_pos[0] + 1][self.agt1_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4-k, 3)
-                if self.raw_occupancy[self.agt1_pos[0] + 2][self.agt1_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4-k, 4)
-
-            # detect self
-            self.paint_agt1(obs, 2, 2, self.agt1_ori)
-
-            # detect agent2
-            for k in range(5):
-                if self.agt2_pos == self.list_add(self.agt1_pos, [-2 + k, 2]):
-                    self.paint_agt2(obs, 0, k, self.agt2_ori)
-                if self.agt2_pos == self.list_add(self.agt1_pos, [-2 + k, 1]):
-                    self.paint_agt2(obs, 1, k, self.agt2_ori)
-                if self.agt2_pos == self.list_add(self.agt1_pos, [-2 + k, 0]):
-                    self.paint_agt2(obs, 2, k, self.agt2_ori)
-                if self.agt2_pos == self.list_add(self.agt1_pos, [-2 + k, -1]):
-                    self.paint_agt2(obs, 3, k, self.agt2_ori)
-                if self.agt2_pos == self.list_add(self.agt1_pos, [-2 + k, -2]):
-                    self.paint_agt2(obs, 4, k, self.agt2_ori)
-
-            # detect pig
-            for k in range(5):
-                if self.pig_pos == self.list_add(self.agt1_pos, [-2 + k, 2]):
-                    self.paint_pig(obs, 0, k, self.pig_ori)
-                if self.pig_pos == self.list_add(self.agt1_pos, [-2 + k, 1]):
-                    self.paint_pig(obs, 1, k, self.pig_ori)
-                if self.pig_pos == self.list_add(self.agt1_pos, [-2 + k, 0]):
-                    self.paint_pig(obs, 2, k, self.pig_ori)
-                if self.pig_pos == self.list_add(self.agt1_pos, [-2 + k, -1]):
-                    self.paint_pig(obs, 3, k, self.pig_ori)
-                if self.pig_pos == self.list_add(self.agt1_pos, [-2 + k, -2]):
-                    self.paint_pig(obs, 4, k, self.pig_ori)
-
-            # add fog
-            if self.agt1_ori == 0:
-                for i in range(5*3):
-                    for j in range(2*3):
-                        obs[i, 14-j, 0] = 0.5
-                        obs[i, 14-j, 1] = 0.5
-                        obs[i, 14-j, 2] = 0.5
-            if self.agt1_ori == 1:
-                for i in range(5*3):
-                    for j in range(2*3):
-                        obs[14-j, i, 0] = 0.5
-                        obs[14-j, i, 1] = 0.5
-                        obs[14-j, i, 2] = 0.5
-            if self.agt1_ori == 2:
-                for i in range(5*3):
-                    for j in range(2*3):
-                        obs[i, j, 0] = 0.5
-                        obs[i, j, 1] = 0.5
-                        obs[i, j, 2] = 0.5
-            if self.agt1_ori == 3:
-                for i in range(5*3):
-                    for j in range(2*3):
-                        obs[j, i, 0] = 0.5
-                        obs[j, i, 1] = 0.5
-                        obs[j, i, 2] = 0.5
+            return np.repeat(self.get_full_obs()[None], self.n_entities, axis=0)
+        return self.get_po_obs(np.arange(self.n_entities))
 
-        return obs
-
-    def get_agt2_obs(self):
-        obs = []
+    def get_agt_obs(self, agt_id):
         if self.if_PO == False:
-            obs = self.get_global_obs()
-        else:
-            obs = np.zeros((5*3, 5*3, 3))
-            for i in range(5*3):
-                for j in range(5*3):
-                    obs[i, j, 0] = 1.0
-                    obs[i, j, 1] = 1.0
-                    obs[i, j, 2] = 1.0
-            for k in range(5):
-                if self.raw_occupancy[self.agt2_pos[0] - 2][self.agt2_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4-k, 0)
-                if self.raw_occupancy[self.agt2_pos[0] - 1][self.agt2_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4-k, 1)
-                if self.raw_occupancy[self.agt2_pos[0]][self.agt2_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4-k, 2)
-                if self.raw_occupancy[self.agt2_pos[0] + 1][self.agt2_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4-k, 3)
-                if self.raw_occupancy[self.agt2_pos[0] + 2][self.agt2_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4-k, 4)
-
-            # detect self
-            self.paint_agt2(obs, 2, 2, self.agt2_ori)
-
-            # detect agent1
-            for k in range(5):
-                if self.agt1_pos == self.list_add(self.agt2_pos, [-2 + k, 2]):
-                    self.paint_agt1(obs, 0, k, self.agt1_ori)
-                if self.agt1_pos == self.list_add(self.agt2_pos, [-2 + k, 1]):
-                    self.paint_agt1(obs, 1, k, self.agt1_ori)
-                if self.agt1_pos == self.list_add(self.agt2_pos, [-2 + k, 0]):
-                    self.paint_agt1(obs, 2, k, self.agt1_ori)
-                if self.agt1_pos == self.list_add(self.agt2_pos, [-2 + k, -1]):
-                    self.paint_agt1(obs, 3, k, self.agt1_ori)
-                if self.agt1_pos == self.list_add(self.agt2_pos, [-2 + k, -2]):
-                    self.paint_agt1(obs, 4, k, self.agt1_ori)
-
-            # detect pig
-            for k in range(5):
-                if self.pig_pos == self.list_add(self.agt2_pos, [-2 + k, 2]):
-                    self.paint_pig(obs, 0, k, self.pig_ori)
-                if self.pig_pos == self.list_add(self.agt2_pos, [-2 + k, 1]):
-                    self.paint_pig(obs, 1, k, self.pig_ori)
-                if self.pig_pos == self.list_add(self.agt2_pos, [-2 + k, 0]):
-                    self.paint_pig(obs, 2, k, self.pig_ori)
-                if self.pig_pos == self.list_add(self.agt2_pos, [-2 + k, -1]):
-                    self.paint_pig(obs, 3, k, self.pig_ori)
-                if self.pig_pos == self.list_add(self.agt2_pos, [-2 + k, -2]):
-                    self.paint_pig(obs, 4, k, self.pig_ori)
-
-            # add fog
-            if self.agt2_ori == 0:
-                for i in range(5*3):
-                    for j in range(2*3):
-                        obs[i, 14-j, 0] = 0.5
-                        obs[i, 14-j, 1] = 0.5
-                        obs[i, 14-j, 2] = 0.5
-            if self.agt2_ori == 1:
-                for i in range(5*3):
-                    for j in range(2*3):
-                        obs[14-j, i, 0] = 0.5
-                        obs[14-j, i, 1] = 0.5
-                        obs[14-j, i, 2] = 0.5
-            if self.agt2_ori == 2:
-                for i in range(5*3):
-                    for j in range(2*3):
-                        obs[i, j, 0] = 0.5
-                        obs[i, j, 1] = 0.5
-                        obs[i, j, 2] = 0.5
-            if self.agt2_ori == 3:
-                for i in range(5*3):
-                    for j in range(2*3):
-                        obs[j, i, 0] = 0.5
-                        obs[j, i, 1] = 0.5
-                        obs[j, i, 2] = 0.5
+            return self.get_full_obs()
+        return self.get_po_obs([agt_id])[0]
 
-        return obs
+    def get_agt1_obs(self):
+        return self.get_agt_obs(0)
 
-    def get_pig_obs(self):
-        obs = []
-        if self.if_PO == False:
-            obs = self.get_global_obs()
-        else:
-            obs = np.zeros((5 * 3, 5 * 3, 3))
-            for i in range(5 * 3):
-                for j in range(5 * 3):
-                    obs[i, j, 0] = 1.0
-                    obs[i, j, 1] = 1.0
-                    obs[i, j, 2] = 1.0
-            for k in range(5):
-                if self.raw_occupancy[self.pig_pos[0] - 2][self.pig_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4 - k, 0)
-                if self.raw_occupancy[self.pig_pos[0] - 1][self.pig_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4 - k, 1)
-                if self.raw_occupancy[self.pig_pos[0]][self.pig_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4 - k, 2)
-                if self.raw_occupancy[self.pig_pos[0] + 1][self.pig_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4 - k, 3)
-                if self.raw_occupancy[self.pig_pos[0] + 2][self.pig_pos[1] + k - 2] == 1:
-                    self.paint_block(obs, 4 - k, 4)
-
-            # detect self
-            self.paint_pig(obs, 2, 2, self.pig_ori)
-
-            # detect agent1
-            for k in range(5):
-                if self.agt1_pos == self.list_add(self.pig_pos, [-2 + k, 2]):
-                    self.paint_agt1(obs, 0, k, self.agt1_ori)
-                if self.agt1_pos == self.list_add(self.pig_pos, [-2 + k, 1]):
-                    self.paint_agt1(obs, 1, k, self.agt1_ori)
-                if self.agt1_pos == self.list_add(self.pig_pos, [-2 + k, 0]):
-                    self.paint_agt1(obs, 2, k, self.agt1_ori)
-                if self.agt1_pos == self.list_add(self.pig_pos, [-2 + k, -1]):
-                    self.paint_agt1(obs, 3, k, self.agt1_ori)
-                if self.agt1_pos == self.list_add(self.pig_pos, [-2 + k, -2]):
-                    self.paint_agt1(obs, 4, k, self.agt1_ori)
-
-
-            # detect agent2
-            for k in range(5):
-                if self.agt2_pos == self.list_add(self.pig_pos, [-2 + k, 2]):
-                    self.paint_agt2(obs, 0, k, self.agt2_ori)
-                if self.agt2_pos == self.list_add(self.pig_pos, [-2 + k, 1]):
-                    self.paint_agt2(obs, 1, k, self.agt2_ori)
-                if self.agt2_pos == self.list_add(self.pig_pos, [-2 + k, 0]):
-                    self.paint_agt2(obs, 2, k, self.agt2_ori)
-                if self.agt2_pos == self.list_add(self.pig_pos, [-2 + k, -1]):
-                    self.paint_agt2(obs, 3, k, self.agt2_ori)
-                if self.agt2_pos == self.list_add(self.pig_pos, [-2 + k, -2]):
-                    self.paint_agt2(obs, 4, k, self.agt2_ori)
-
-            # add fog
-            if self.pig_ori == 0:
-                for i in range(5 * 3):
-                    for j in range(2 * 3):
-                        obs[i, 14 - j, 0] = 0.5
-                        obs[i, 14 - j, 1] = 0.5
-                        obs[i, 14 - j, 2] = 0.5
-            if self.pig_ori == 1:
-                for i in range(5 * 3):
-                    for j in range(2 * 3):
-                        obs[14 - j, i, 0] = 0.5
-                        obs[14 - j, i, 1] = 0.5
-                        obs[14 - j, i, 2] = 0.5
-            if self.pig_ori == 2:
-                for i in range(5 * 3):
-                    for j in range(2 * 3):
-                        obs[i, j, 0] = 0.5
-                        obs[i, j, 1] = 0.5
-                        obs[i, j, 2] = 0.5
-            if self.pig_ori == 3:
-                for i in range(5 * 3):
-                    for j in range(2 * 3):
-                        obs[j, i, 0] = 0.5
-                        obs[j, i, 1] = 0.5
-                        obs[j, i, 2] = 0.5
+    def get_agt2_obs(self):
+        return self.get_agt_obs(1)
 
-        return obs
+    def get_pig_obs(self):
+        return self.get_agt_obs(self.n_agents)
 
     def get_obs(self):
-        return [self.get_agt1_obs(), self.get_agt2_obs()]
+        return [self.get_agt_obs(i) for i in range(self.n_agents)]
 
     def get_full_obs(self):
-        obs = np.zeros((self.map_size*3, self.map_size*3, 3))
-        for i in range(self.map_size*3):
-            for j in range(self.map_size*3):
-                obs[i, j, 0] = 1.0
-                obs[i, j, 1] = 1.0
-                obs[i, j, 2] = 1.0
-        for i in range(self.map_size):
-            for j in range(self.map_size):
-                if self.raw_occupancy[i][j] == 1:
-                    self.paint_block(obs, i, j)
-        self.paint_agt1(obs, self.map_size - self.agt1_pos[1] - 1, self.agt1_pos[0], self.agt1_ori)
-        self.paint_agt2(obs, self.map_size - self.agt2_pos[1] - 1, self.agt2_pos[0], self.agt2_ori)
-        self.paint_pig(obs, self.map_size - self.pig_pos[1] - 1, self.pig_pos[0], self.pig_ori)
-        return obs
+        # walls are drawn at [i, j] = raw_occupancy[i][j], entities at [map_size - y - 1, x]
+        code = self.raw_occupancy.astype(np.int64)
+        code[self.map_size - self.positions[:, 1] - 1, self.positions[:, 0]] = 2 + 4 * self.colors + self.orientations
+        obs = CATCH_PIGS_TILES[code].transpose(0, 2, 1, 3, 4)
+        return obs.reshape(self.map_size * 3, self.map_size * 3, 3)
 
     def step(self, action_list):
-        reward_1 = 0
-        reward_2 = 0
-        reward_pig = 0
-
-        # agent1 move
-        if action_list[0] == 0:    # turn left
-            reward_1 = reward_1 - 1
-            if self.agt1_ori == 0:
-                self.agt1_ori = 3
-            elif self.agt1_ori == 1:
-                self.agt1_ori = 0
-            elif self.agt1_ori == 2:
-                self.agt1_ori = 1
-            elif self.agt1_ori == 3:
-                self.agt1_ori = 2
-
-        elif action_list[0] == 1:  # turn right
-            reward_1 = reward_1 - 1
-            if self.agt1_ori == 0:
-                self.agt1_ori = 1
-            elif self.agt1_ori == 1:
-                self.agt1_ori = 2
-            elif self.agt1_ori == 2:
-                self.agt1_ori = 3
-            elif self.agt1_ori == 3:
-                self.agt1_ori = 0
-
-        elif action_list[0] == 2:  # move
-            reward_1 = reward_1 - 1
-            if self.agt1_ori == 0:
-                if self.occupancy[self.agt1_pos[0] - 1][self.agt1_pos[1]] != 1:  # if can move
-                    self.agt1_pos[0] = self.agt1_pos[0] - 1
-                    self.occupancy[self.agt1_pos[0] + 1][self.agt1_pos[1]] = 0
-                    self.occupancy[self.agt1_pos[0]][self.agt1_pos[1]] = 1
-                else:
-                    reward_1 = reward_1 - 20
-            elif self.agt1_ori == 1:
-                if self.occupancy[self.agt1_pos[0]][self.agt1_pos[1] + 1] != 1:  # if can move
-                    self.agt1_pos[1] = self.agt1_pos[1] + 1
-                    self.occupancy[self.agt1_pos[0]][self.agt1_pos[1] - 1] = 0
-                    self.occupancy[self.agt1_pos[0]][self.agt1_pos[1]] = 1
-                else:
-                    reward_1 = reward_1 - 20
-            elif self.agt1_ori == 2:
-                if self.occupancy[self.agt1_pos[0] + 1][self.agt1_pos[1]] != 1:  # if can move
-                    self.agt1_pos[0] = self.agt1_pos[0] + 1
-                    self.occupancy[self.agt1_pos[0] - 1][self.agt1_pos[1]] = 0
-                    self.occupancy[self.agt1_pos[0]][self.agt1_pos[1]] = 1
-                else:
-                    reward_1 = reward_1 - 20
-            elif self.agt1_ori == 3:
-                if self.occupancy[self.agt1_pos[0]][self.agt1_pos[1] - 1] != 1:  # if can move
-                    self.agt1_pos[1] = self.agt1_pos[1] - 1
-                    self.occupancy[self.agt1_pos[0]][self.agt1_pos[1] + 1] = 0
-                    self.occupancy[self.agt1_pos[0]][self.agt1_pos[1]] = 1
-                else:
-                    reward_1 = reward_1 - 20
-
-        elif action_list[0] == 3:  # catch
-            reward_1 = reward_1 - 1
-            if self.agt1_ori == 0:
-                if self.pig_pos[0] == self.agt1_pos[0]-1:
-                    if self.pig_pos[1] == self.agt1_pos[1]:
-                        self.if_agt1_catches = True
-            elif self.agt1_ori == 1:
-                if self.pig_pos[1] == self.agt1_pos[1]+1:
-                    if self.pig_pos[0] == self.agt1_pos[0]:
-                        self.if_agt1_catches = True
-            elif self.agt1_ori == 2:
-                if self.pig_pos[0] == self.agt1_pos[0]+1:
-                    if self.pig_pos[1] == self.agt1_pos[1]:
-                        self.if_agt1_catches = True
-            elif self.agt1_ori == 3:
-                if self.pig_pos[1] == self.agt1_pos[1]-1:
-                    if self.pig_pos[0] == self.agt1_pos[0]:
-                        self.if_agt1_catches = True
-
-        # agent2 move
-        if action_list[1] == 0:    # turn left
-            reward_2 = reward_2 - 1
-            if self.agt2_ori == 0:
-                self.agt2_ori = 3
-            elif self.agt2_ori == 1:
-                self.agt2_ori = 0
-            elif self.agt2_ori == 2:
-                self.agt2_ori = 1
-            elif self.agt2_ori == 3:
-                self.agt2_ori = 2
-
-        elif action_list[1] == 1:  # turn right
-            reward_2 = reward_2 - 1
-            if self.agt2_ori == 0:
-                self.agt2_ori = 1
-            elif self.agt2_ori == 1:
-                self.agt2_ori = 2
-            elif self.agt2_ori == 2:
-                self.agt2_ori = 3
-            elif self.agt2_ori == 3:
-                self.agt2_ori = 0
-
-        elif action_list[1] == 2:  # move
-            reward_2 = reward_2 - 1
-            if self.agt2_ori == 0:
-                if self.occupancy[self.agt2_pos[0] - 1][self.agt2_pos[1]] != 1:  # if can move
-                    self.agt2_pos[0] = self.agt2_pos[0] - 1
-                    self.occupancy[self.agt2_pos[0] + 1][self.agt2_pos[1]] = 0
-                    self.occupancy[self.agt2_pos[0]][self.agt2_pos[1]] = 1
-                else:
-                    reward_2 = reward_2 - 20
-            elif self.agt2_ori == 1:
-                if self.occupancy[self.agt2_pos[0]][self.agt2_pos[1] + 1] != 1:  # if can move
-                    self.agt2_pos[1] = self.agt2_pos[1] + 1
-                    self.occupancy[self.agt2_pos[0]][self.agt2_pos[1] - 1] = 0
-                    self.occupancy[self.agt2_pos[0]][self.agt2_pos[1]] = 1
-                else:
-                    reward_2 = reward_2 - 20
-            elif self.agt2_ori == 2:
-                if self.occupancy[self.agt2_pos[0] + 1][self.agt2_pos[1]] != 1:  # if can move
-                    self.agt2_pos[0] = self.agt2_pos[0] + 1
-                    self.occupancy[self.agt2_pos[0] - 1][self.agt2_pos[1]] = 0
-                    self.occupancy[self.agt2_pos[0]][self.agt2_pos[1]] = 1
-                else:
-                    reward_2 = reward_2 - 20
-            elif self.agt2_ori == 3:
-                if self.occupancy[self.agt2_pos[0]][self.agt2_pos[1] - 1] != 1:  # if can move
-                    self.agt2_pos[1] = self.agt2_pos[1] - 1
-                    self.occupancy[self.agt2_pos[0]][self.agt2_pos[1] + 1] = 0
-                    self.occupancy[self.agt2_pos[0]][self.agt2_pos[1]] = 1
-                else:
-                    reward_2 = reward_2 - 20
-
-        elif action_list[1] == 3:  # catch
-            reward_2 = reward_2 - 1
-            if self.agt2_ori == 0:
-                if self.pig_pos[0] == self.agt2_pos[0]-1:
-                    if self.pig_pos[1] == self.agt2_pos[1]:
-                        self.if_agt2_catches = True
-            elif self.agt2_ori == 1:
-                if self.pig_pos[1] == self.agt2_pos[1]+1:
-                    if self.pig_pos[0] == self.agt2_pos[0]:
-                        self.if_agt2_catches = True
-            elif self.agt2_ori == 2:
-                if self.pig_pos[0] == self.agt2_pos[0]+1:
-                    if self.pig_pos[1] == self.agt2_pos[1]:
-                        self.if_agt2_catches = True
-            elif self.agt2_ori == 3:
-                if self.pig_pos[1] == self.agt2_pos[1]-1:
-                    if self.pig_pos[0] == self.agt2_pos[0]:
-                        self.if_agt2_catches = True
-
-        # pig move
-        action_pig = random.randint(0,3)
-        if action_pig == 0:  # turn left
-            reward_pig = reward_pig - 1
-            if self.pig_ori == 0:
-                self.pig_ori = 3
-            elif self.pig_ori == 1:
-                self.pig_ori = 0
-            elif self.pig_ori == 2:
-                self.pig_ori = 1
-            elif self.pig_ori == 3:
-                self.pig_ori = 2
-
-        elif action_pig == 1:  # turn right
-            reward_pig = reward_pig - 1
-            if self.pig_ori == 0:
-                self.pig_ori = 1
-            elif self.pig_ori == 1:
-                self.pig_ori = 2
-            elif self.pig_ori == 2:
-                self.pig_ori = 3
-            elif self.pig_ori == 3:
-                self.pig_ori = 0
-
-        elif action_pig == 2:  # move
-            reward_pig = reward_pig - 1
-            if self.pig_ori == 0:
-                if self.occupancy[self.pig_pos[0] - 1][self.pig_pos[1]] != 1:  # if can move
-                    self.pig_pos[0] = self.pig_pos[0] - 1
-                    self.occupancy[self.pig_pos[0] + 1][self.pig_pos[1]] = 0
-                    self.occupancy[self.pig_pos[0]][self.pig_pos[1]] = 1
-                    self.if_agt1_catches = False
-                    self.if_agt2_catches = False
-                else:
-                    reward_pig = reward_pig - 20
-            elif self.pig_ori == 1:
-                if self.occupancy[self.pig_pos[0]][self.pig_pos[1] + 1] != 1:  # if can move
-                    self.pig_pos[1] = self.pig_pos[1] + 1
-                    self.occupancy[self.pig_pos[0]][self.pig_pos[1] - 1] = 0
-                    self.occupancy[self.pig_pos[0]][self.pig_pos[1]] = 1
-                    self.if_agt1_catches = False
-                    self.if_agt2_catches = False
-                else:
-                    reward_pig = reward_pig - 20
-            elif self.pig_ori == 2:
-                if self.occupancy[self.pig_pos[0] + 1][self.pig_pos[1]] != 1:  # if can move
-                    self.pig_pos[0] = self.pig_pos[0] + 1
-                    self.occupancy[self.pig_pos[0] - 1][self.pig_pos[1]] = 0
-                    self.occupancy[self.pig_pos[0]][self.pig_pos[1]] = 1
-                    self.if_agt1_catches = False
-                    self.if_agt2_catches = False
-                else:
-                    reward_pig = reward_pig - 20
-            elif self.pig_ori == 3:
-                if self.occupancy[self.pig_pos[0]][self.pig_pos[1] - 1] != 1:  # if can move
-                    self.pig_pos[1] = self.pig_pos[1] - 1
-                    self.occupancy[self.pig_pos[0]][self.pig_pos[1] + 1] = 0
-                    self.occupancy[self.pig_pos[0]][self.pig_pos[1]] = 1
-                    self.if_agt1_catches = False
-                    self.if_agt2_catches = False
-                else:
-                    reward_pig = reward_pig - 20
-
-        # check if caught
-        if (self.if_agt1_catches == True) and (self.if_agt2_catches == True):
-            reward_1 = reward_1 + 500
-            reward_2 = reward_2 + 500
-            reward_pig = reward_pig - 500
-            self.reset()
-        else:
-            if action_list[1] == 3:
-                reward_2 = reward_2 - 50
-            if action_list[0] == 3:
-                reward_1 = reward_1 - 50
-
-        self.if_agt1_catches = False
-        self.if_agt2_catches = False
+        # action_list holds one action per hunter: 0 turn left, 1 turn right, 2 move, 3 catch, 4 wait
+        n = self.n_agents
+        actions = np.empty(self.n_entities, dtype=np.int64)
+        actions[:n] = action_list[:n]
+        actions[n:] = [random.randint(0, 3) for _ in range(self.n_pigs)]
+
+        # turns
+        self.orientations = CATCH_PIGS_TURNS[actions, self.orientations]
+
+        # moves, entities act in index order so each one sees the cells of earlier entities after they moved
+        old_cell = self.positions @ self.cell_stride
+        target_cell = old_cell + self.heading_cells[self.orientations]
+        is_move = actions == 2
+        on_old = target_cell[:, None] == old_cell
+        free = is_move & (self.raw_flat[target_cell] != 1) & ~(on_old & self.later).any(axis=1)
+        moved = free
+        if free.any():
+            on_target = target_cell[:, None] == target_cell
+            # a move only depends on the entities before it, so this settles in at most n_entities passes
+            for _ in range(self.n_entities):
+                ends_there = np.where(moved, on_target, on_old) & self.earlier
+                settled = free & ~ends_there.any(axis=1)
+                if (settled == moved).all():
+                    break
+                moved = settled
+            occ = self.occupancy.reshape(-1)
+            occ[old_cell[moved]] = 0
+            occ[target_cell[moved]] = 1
+            self.positions = np.where(moved[:, None], self.positions + CATCH_PIGS_HEADINGS[self.orientations], self.positions)
+
+        # catches, a hunter catches a pig it faces before the pig moves, a pig that gets away clears them
+        catching = actions[:n] == 3
+        reward = -1 * (actions[:n] < 4) - 20 * (is_move[:n] & ~moved[:n]) - 50 * catching
         done = False
-        if reward_1>0:
-            done = True
-        return [reward_1, reward_2], done
+        if catching.any():
+            catches = catching[:, None] & (target_cell[:n, None] == old_cell[n:]) & ~moved[n:]
+            caught = catches.sum(axis=0) >= CATCH_PIGS_CATCHERS
+            if caught.any():
+                reward = reward + 550 * catches[:, caught].any(axis=1)
+                self.reset()
+                done = True
+        return reward.tolist(), done
 
     def plot_scene(self):
+        if HEADLESS:
+            return
+        import matplotlib.pyplot as plt
+        from matplotlib.gridspec import GridSpec
         fig = plt.figure(figsize=(5, 5))
         gs = GridSpec(3, 3, figure=fig)
         ax1 = fig.add_subplot(gs[0:2, 0:3])
@@ -849,85 +256,46 @@ class EnvCatchPigs(object):
 
         plt.show()
 
-    def set_agt1_at(self, tgt_pos, tgt_ori):
+    def set_entity_at(self, entity_id, tgt_pos, tgt_ori):
         if self.occupancy[tgt_pos[0]][tgt_pos[1]] == 0:     # free space
-            self.occupancy[self.agt1_pos[0]][self.agt1_pos[1]] = 0
-            self.agt1_pos = tgt_pos
-            self.occupancy[self.agt1_pos[0]][self.agt1_pos[1]] = 1
-            self.agt1_ori = tgt_ori
+            self.occupancy[self.positions[entity_id, 0]][self.positions[entity_id, 1]] = 0
+            self.positions[entity_id] = tgt_pos
+            self.occupancy[tgt_pos[0]][tgt_pos[1]] = 1
+            self.orientations[entity_id] = tgt_ori
+
+    def set_agt1_at(self, tgt_pos, tgt_ori):
+        self.set_entity_at(0, tgt_pos, tgt_ori)
 
     def set_agt2_at(self, tgt_pos, tgt_ori):
-        if self.occupancy[tgt_pos[0]][tgt_pos[1]] == 0:     # free space
-            self.occupancy[self.agt2_pos[0]][self.agt2_pos[1]] = 0
-            self.agt2_pos = tgt_pos
-            self.occupancy[self.agt2_pos[0]][self.agt2_pos[1]] = 1
-            self.agt2_ori = tgt_ori
+        self.set_entity_at(1, tgt_pos, tgt_ori)
 
     def set_pig_at(self, tgt_pos, tgt_ori):
-        if self.occupancy[tgt_pos[0]][tgt_pos[1]] == 0:     # free space
-            self.occupancy[self.pig_pos[0]][self.pig_pos[1]] = 0
-            self.pig_pos = tgt_pos
-            self.occupancy[self.pig_pos[0]][self.pig_pos[1]] = 1
-            self.pig_ori = tgt_ori
+        self.set_entity_at(self.n_agents, tgt_pos, tgt_ori)
 
     def render(self):
+        if HEADLESS:
+            return
+        import cv2
         obs = np.ones((self.map_size*21, self.map_size*21, 3))
         for i in range(self.map_size):
             for j in range(self.map_size):
                 if self.raw_occupancy[i, j] == 1:
                     cv2.rectangle(obs, (i*21, j*21), (i*21+21, j*21+21), (0, 0, 0), -1)
-        # plot agent1
-        temp_x = self.agt1_pos[0]
-        temp_y = self.map_size - self.agt1_pos[1] - 1
-        if self.agt1_ori == 0:
-            cv2.rectangle(obs, (temp_x * 21, temp_y * 21), (temp_x * 21 + 7, temp_y * 21 + 21), (0, 0, 255), -1)
-            cv2.rectangle(obs, (temp_x * 21 + 7, temp_y * 21 + 7), (temp_x * 21 + 21, temp_y * 21 + 14), (0, 0, 255),
-                          -1)
-        elif self.agt1_ori==1:
-            cv2.rectangle(obs, (temp_x * 21, temp_y * 21), (temp_x * 21 + 21, temp_y * 21 + 7), (0, 0, 255), -1)
-            cv2.rectangle(obs, (temp_x * 21 + 7, temp_y * 21 + 7), (temp_x * 21 + 14, temp_y * 21 + 21), (0, 0, 255),
-                          -1)
-        elif self.agt1_ori == 2:
-            cv2.rectangle(obs, (temp_x * 21, temp_y * 21 + 7), (temp_x * 21 + 14, temp_y * 21 + 14), (0, 0, 255), -1)
-            cv2.rectangle(obs, (temp_x * 21 + 14, temp_y * 21), (temp_x * 21 + 21, temp_y * 21 + 21), (0, 0, 255), -1)
-        else:
-            cv2.rectangle(obs, (temp_x * 21, temp_y * 21 + 14), (temp_x * 21 + 21, temp_y * 21 + 21), (0, 0, 255), -1)
-            cv2.rectangle(obs, (temp_x * 21 + 7, temp_y * 21), (temp_x * 21 + 14, temp_y * 21 + 14), (0, 0, 255), -1)
-
-        # plot agent2
-        temp_x = self.agt2_pos[0]
-        temp_y = self.map_size - self.agt2_pos[1] - 1
-        if self.agt2_ori == 0:
-            cv2.rectangle(obs, (temp_x * 21, temp_y * 21), (temp_x * 21 + 7, temp_y * 21 + 21), (255, 0, 0), -1)
-            cv2.rectangle(obs, (temp_x * 21 + 7, temp_y * 21 + 7), (temp_x * 21 + 21, temp_y * 21 + 14), (255, 0, 0),
-                          -1)
-        elif self.agt2_ori==1:
-            cv2.rectangle(obs, (temp_x * 21, temp_y * 21), (temp_x * 21 + 21, temp_y * 21 + 7), (255, 0, 0), -1)
-            cv2.rectangle(obs, (temp_x * 21 + 7, temp_y * 21 + 7), (temp_x * 21 + 14, temp_y * 21 + 21), (255, 0, 0),
-                          -1)
-        elif self.agt2_ori == 2:
-            cv2.rectangle(obs, (temp_x * 21, temp_y * 21 + 7), (temp_x * 21 + 14, temp_y * 21 + 14), (255, 0, 0), -1)
-            cv2.rectangle(obs, (temp_x * 21 + 14, temp_y * 21), (temp_x * 21 + 21, temp_y * 21 + 21), (255, 0, 0), -1)
-        else:
-            cv2.rectangle(obs, (temp_x * 21, temp_y * 21 + 14), (temp_x * 21 + 21, temp_y * 21 + 21), (255, 0, 0), -1)
-            cv2.rectangle(obs, (temp_x * 21 + 7, temp_y * 21), (temp_x * 21 + 14, temp_y * 21 + 14), (255, 0, 0), -1)
-
-        # plot pig
-        temp_x = self.pig_pos[0]
-        temp_y = self.map_size - self.pig_pos[1] - 1
-        if self.pig_ori == 0:
-            cv2.rectangle(obs, (temp_x * 21, temp_y * 21), (temp_x * 21 + 7, temp_y * 21 + 21), (0, 255, 0), -1)
-            cv2.rectangle(obs, (temp_x * 21 + 7, temp_y * 21 + 7), (temp_x * 21 + 21, temp_y * 21 + 14), (0, 255, 0),
-                          -1)
-        elif self.pig_ori == 1:
-            cv2.rectangle(obs, (temp_x * 21, temp_y * 21), (temp_x * 21 + 21, temp_y * 21 + 7), (0, 255, 0), -1)
-            cv2.rectangle(obs, (temp_x * 21 + 7, temp_y * 21 + 7), (temp_x * 21 + 14, temp_y * 21 + 21), (0, 255, 0),
-                          -1)
-        elif self.pig_ori == 2:
-            cv2.rectangle(obs, (temp_x * 21, temp_y * 21 + 7), (temp_x * 21 + 14, temp_y * 21 + 14), (0, 255, 0), -1)
-            cv2.rectangle(obs, (temp_x * 21 + 14, temp_y * 21), (temp_x * 21 + 21, temp_y * 21 + 21), (0, 255, 0), -1)
-        else:
-            cv2.rectangle(obs, (temp_x * 21, temp_y * 21 + 14), (temp_x * 21 + 21, temp_y * 21 + 21), (0, 255, 0), -1)
-            cv2.rectangle(obs, (temp_x * 21 + 7, temp_y * 21), (temp_x * 21 + 14, temp_y * 21 + 14), (0, 255, 0), -1)
+        for k in range(self.n_entities):
+            color = CATCH_PIGS_RENDER_COLORS[self.colors[k]]
+            temp_x = int(self.positions[k, 0])
+            temp_y = int(self.map_size - self.positions[k, 1] - 1)
+            if self.orientations[k] == 0:
+                cv2.rectangle(obs, (temp_x * 21, temp_y * 21), (temp_x * 21 + 7, temp_y * 21 + 21), color, -1)
+                cv2.rectangle(obs, (temp_x * 21 + 7, temp_y * 21 + 7), (temp_x * 21 + 21, temp_y * 21 + 14), color, -1)
+            elif self.orientations[k] == 1:
+                cv2.rectangle(obs, (temp_x * 21, temp_y * 21), (temp_x * 21 + 21, temp_y * 21 + 7), color, -1)
+                cv2.rectangle(obs, (temp_x * 21 + 7, temp_y * 21 + 7), (temp_x * 21 + 14, temp_y * 21 + 21), color, -1)
+            elif self.orientations[k] == 2:
+                cv2.rectangle(obs, (temp_x * 21, temp_y * 21 + 7), (temp_x * 21 + 14, temp_y * 21 + 14), color, -1)
+                cv2.rectangle(obs, (temp_x * 21 + 14, temp_y * 21), (temp_x * 21 + 21, temp_y * 21 + 21), color, -1)
+            else:
+                cv2.rectangle(obs, (temp_x * 21, temp_y * 21 + 14), (temp_x * 21 + 21, temp_y * 21 + 21), color, -1)
+                cv2.rectangle(obs, (temp_x * 21 + 7, temp_y * 21), (temp_x * 21 + 14, temp_y * 21 + 14), color, -1)
         cv2.imshow('image', obs)
-        cv2.waitKey(10)
\ No newline at end of file
+        cv2.waitKey(10)
@@ -1,83 +1,63 @@
+import os
 import numpy as np
 import maze
 import random
-import cv2
+
+HEADLESS = os.environ.get('MAENV_HEADLESS', '0') != '0'
 
 class EnvCleaner(object):
+    # global obs colour of occupancy 0 (clean), 1 (wall) and 2 (dirty)
+    PALETTE = np.array([[1.0, 1.0, 1.0], [0.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+
     def __init__(self, N_agent, map_size, seed):
         self.map_size = map_size
         self.seed = seed
-        self.occupancy = self.generate_maze(seed)
+        self.init_occupancy = self.generate_maze(seed)
+        self.init_dirty_num = int(np.count_nonzero(self.init_occupancy == 2))
+        self.init_obs_map = self.PALETTE[self.init_occupancy]
+        # flat index move of actions up, down, left, right
+        self.move_offsets = np.array([-map_size, map_size, -1, 1])
         self.N_agent = N_agent
-        self.agt_pos_list = []
-        for i in range(self.N_agent):
-            self.agt_pos_list.append([1, 1])
+        self.reset()
 
     def generate_maze(self, seed):
-        symbols = {
-            # default symbols
-            'start': 'S',
-            'end': 'X',
-            'wall_v': '|',
-            'wall_h': '-',
-            'wall_c': '+',
-            'head': '#',
-            'tail': 'o',
-            'empty': ' '
-        }
-        maze_obj = maze.Maze(int((self.map_size - 1) / 2), int((self.map_size - 1) / 2), seed, symbols, 1)
-        grid_map = maze_obj.to_np()
-        for i in range(self.map_size):
-            for j in range(self.map_size):
-                if grid_map[i][j] == 0:
-                    grid_map[i][j] = 2
-        return grid_map
+        # the walls come from the (map_size, seed) keyed maze cache, every free cell starts dirty
+        grid_map = maze.cached_grid(int((self.map_size - 1) / 2), int((self.map_size - 1) / 2), seed)
+        return np.where(grid_map == 0, 2, grid_map)
 
     def step(self, action_list):
-        reward = 0
-        for i in range(len(action_list)):
-            if action_list[i] == 0:     # up
-                if self.occupancy[self.agt_pos_list[i][0] - 1][self.agt_pos_list[i][1]] != 1:  # if can move
-                    self.agt_pos_list[i][0] = self.agt_pos_list[i][0] - 1
-            if action_list[i] == 1:     # down
-                if self.occupancy[self.agt_pos_list[i][0] + 1][self.agt_pos_list[i][1]] != 1:  # if can move
-                    self.agt_pos_list[i][0] = self.agt_pos_list[i][0] + 1
-            if action_list[i] == 2:     # left
-                if self.occupancy[self.agt_pos_list[i][0]][self.agt_pos_list[i][1] - 1] != 1:  # if can move
-                    self.agt_pos_list[i][1] = self.agt_pos_list[i][1] - 1
-            if action_list[i] == 3:     # right
-                if self.occupancy[self.agt_pos_list[i][0]][self.agt_pos_list[i][1] + 1] != 1:  # if can move
-                    self.agt_pos_list[i][1] = self.agt_pos_list[i][1] + 1
-            if self.occupancy[self.agt_pos_list[i][0]][self.agt_pos_list[i][1]] == 2:   # if the spot is dirty
-                self.occupancy[self.agt_pos_list[i][0]][self.agt_pos_list[i][1]] = 0
-                reward = reward + 1
-        return reward
+        # all agents move at once on the flattened map, a move into a wall is skipped, agents may share a cell
+        new_cells = self.agt_cells + self.move_offsets[action_list]
+        self.agt_cells = np.where(self.occupancy.ravel()[new_cells] == 1, self.agt_cells, new_cells)
+        self.agt_pos_list = np.column_stack(np.divmod(self.agt_cells, self.map_size))
+        # a dirty cell reached by several agents is cleaned, and rewarded, once
+        cells = np.unique(self.agt_cells)
+        cells = cells[self.occupancy.ravel()[cells] == 2]
+        self.occupancy.ravel()[cells] = 0
+        self.obs_map.reshape(-1, 3)[cells] = self.PALETTE[0]
+        self.dirty_num -= len(cells)
+        return len(cells)
+
+    def is_episode_finish(self):
+        return self.dirty_num == 0
 
     def get_global_obs(self):
-        obs = np.zeros((self.map_size, self.map_size, 3))
-        for i in range(self.map_size):
-            for j in range(self.map_size):
-                if self.occupancy[i, j] == 0:
-                    obs[i, j, 0] = 1.0
-                    obs[i, j, 1] = 1.0
-                    obs[i, j, 2] = 1.0
-                if self.occupancy[i, j] == 2:
-                    obs[i, j, 0] = 0.0
-                    obs[i, j, 1] = 1.0
-                    obs[i, j, 2] = 0.0
-        for i in range(self.N_agent):
-            obs[self.agt_pos_list[i][0], self.agt_pos_list[i][1], 0] = 1.0
-            obs[self.agt_pos_list[i][0], self.agt_pos_list[i][1], 1] = 0.0
-            obs[self.agt_pos_list[i][0], self.agt_pos_list[i][1], 2] = 0.0
+        # obs_map follows the occupancy as cells are cleaned, only the agents are drawn per call
+        obs = self.obs_map.copy()
+        obs[self.agt_pos_list[:, 0], self.agt_pos_list[:, 1]] = [1.0, 0.0, 0.0]
         return obs
 
     def reset(self):
-        self.occupancy = self.generate_maze(self.seed)
-        self.agt_pos_list = []
-        for i in range(self.N_agent):
-            self.agt_pos_list.append([1, 1])
+        self.occupancy = self.init_occupancy.copy()
+        self.obs_map = self.init_obs_map.copy()
+        self.dirty_num = self.init_dirty_num
+        self.agt_pos_list = np.ones((self.N_agent, 2), dtype=int)
+        self.agt_cells = np.full(self.N_agent, self.map_size + 1)
 
     def render(self):
+        if HEADLESS:
+            return
+        import cv2
         obs = self.get_global_obs()
         enlarge = 5
         new_obs = np.ones((self.map_size*enlarge, self.map_size*enlarge, 3))
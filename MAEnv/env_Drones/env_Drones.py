@@ -1,16 +1,42 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
 import random
 
+# palette codes: 0 free (white), 1 wall (black), 2 tree (green), 3 out of view (grey), 4 human (red)
+DRONES_PALETTE = np.array([[1.0, 1.0, 1.0],
+                           [0.0, 0.0, 0.0],
+                           [0.0, 1.0, 0.0],
+                           [0.5, 0.5, 0.5],
+                           [1.0, 0.0, 0.0]])
+# action id -> (dx, dy): 0 x - 1, 1 x + 1, 2 y - 1, 3 y + 1, 4 stay
+DRONES_MOVES = np.array([[-1, 0], [1, 0], [0, -1], [0, 1], [0, 0]])
+
+
 class Drones(object):
+    # pos_row is a row of EnvDrones.drone_pos, so reading or writing pos goes straight to the array
     def __init__(self, pos, view_range):
-        self.pos = pos
+        self.pos_row = pos if isinstance(pos, np.ndarray) else np.array(pos)
         self.view_range = view_range
 
+    @property
+    def pos(self):
+        return self.pos_row
+
+    @pos.setter
+    def pos(self, value):
+        self.pos_row[:] = value
+
 class Human(object):
+    # pos_row is a row of EnvDrones.human_pos
     def __init__(self, pos):
-        self.pos = pos
+        self.pos_row = pos if isinstance(pos, np.ndarray) else np.array(pos)
+
+    @property
+    def pos(self):
+        return self.pos_row
+
+    @pos.setter
+    def pos(self, value):
+        self.pos_row[:] = value
 
 class EnvDrones(object):
     def __init__(self, map_size, drone_num, view_range, tree_num, human_num):
@@ -34,22 +60,31 @@ class EnvDrones(object):
             self.land_mark_map[temp_pos[0], temp_pos[1]] = 2
 
 
-        # initialize humans
-        self.human_list = []
+        # initialize humans, (human_num, 2) positions with a Human view per row
+        self.human_pos = np.zeros((self.human_num, 2), dtype=np.int64)
         for i in range(self.human_num):
             temp_pos = [random.randint(0, self.map_size-1), random.randint(0, self.map_size-1)]
             while self.land_mark_map[temp_pos[0], temp_pos[1]] != 0:
                 temp_pos = [random.randint(0, self.map_size-1), random.randint(0, self.map_size-1)]
-            temp_human = Human(temp_pos)
-            self.human_list.append(temp_human)
-
+            self.human_pos[i] = temp_pos
+        self.human_list = [Human(self.human_pos[i]) for i in range(self.human_num)]
 
-        # initialize drones
+        # initialize drones, each one gets its own copy of the start position
         self.start_pos = [self.map_size-1, self.map_size-1]
-        self.drone_list = []
-        for i in range(drone_num):
-            temp_drone = Drones(self.start_pos, view_range)
-            self.drone_list.append(temp_drone)
+        self.drone_pos = np.tile(np.array(self.start_pos, dtype=np.int64), (drone_num, 1))
+        self.drone_list = [Drones(self.drone_pos[i], view_range) for i in range(drone_num)]
+
+        # land marks padded with out-of-map cells so every drone window is a plain slice
+        self.view_pad = view_range - 1
+        self.padded_land_mark = np.pad(self.land_mark_map.astype(np.int64), self.view_pad, constant_values=3)
+        self.view_masks = {}
+        self.scene_code = None
+        self.scene_human_pos = None
+        # persistent state of get_joint_obs: how many drones see each padded cell, and the painted image
+        self.joint_cover = None
+        self.joint_obs = None
+        self.joint_drone_pos = None
+        self.joint_human_pos = None
 
     def get_full_obs(self):
         obs = np.ones((self.map_size, self.map_size, 3))
@@ -64,115 +99,113 @@ class EnvDrones(object):
                     obs[i, j, 1] = 1
                     obs[i, j, 2] = 0
 
-        for i in range(self.human_num):
-            obs[self.human_list[i].pos[0], self.human_list[i].pos[1], 0] = 1
-            obs[self.human_list[i].pos[0], self.human_list[i].pos[1], 1] = 0
-            obs[self.human_list[i].pos[0], self.human_list[i].pos[1], 2] = 0
+        obs[self.human_pos[:, 0], self.human_pos[:, 1]] = DRONES_PALETTE[4]
         return obs
 
+    def get_view_mask(self, view_range):
+        # cells of a (2 * view_range - 1)^2 window that lie outside the drone's circular view
+        if view_range not in self.view_masks:
+            offset = np.arange(2 * view_range - 1) - (view_range - 1)
+            self.view_masks[view_range] = offset[:, None] ** 2 + offset[None, :] ** 2 > view_range * view_range
+        return self.view_masks[view_range]
+
+    def get_scene_code(self):
+        # padded map of palette codes with humans scattered in, rebuilt only when a human has moved
+        human_pos = self.human_pos.copy()
+        if self.scene_human_pos is None or not np.array_equal(human_pos, self.scene_human_pos):
+            scene = self.padded_land_mark.copy()
+            hx = human_pos[:, 0] + self.view_pad
+            hy = human_pos[:, 1] + self.view_pad
+            free = scene[hx, hy] == 0
+            scene[hx[free], hy[free]] = 4
+            self.scene_code = scene
+            self.scene_human_pos = human_pos
+        return self.scene_code
+
     def get_drone_obs(self, drone):
         obs_size = 2 * drone.view_range - 1
-        obs = np.ones((obs_size, obs_size, 3))
-        for i in range(obs_size):
-            for j in range(obs_size):
-                x = i + drone.pos[0] - drone.view_range + 1
-                y = j + drone.pos[1] - drone.view_range + 1
-
-                for k in range(self.human_num):
-                    if self.human_list[k].pos[0] == x and self.human_list[k].pos[1] == y:
-                        obs[i, j, 0] = 1
-                        obs[i, j, 1] = 0
-                        obs[i, j, 2] = 0
-
-                if x>=0 and x<=self.map_size-1 and y>=0 and y<=self.map_size-1:
-                    if self.land_mark_map[x, y] == 1:
-                        obs[i, j, 0] = 0
-                        obs[i, j, 1] = 0
-                        obs[i, j, 2] = 0
-                    if self.land_mark_map[x, y] == 2:
-                        obs[i, j, 0] = 0
-                        obs[i, j, 1] = 1
-                        obs[i, j, 2] = 0
-                else:
-                    obs[i, j, 0] = 0.5
-                    obs[i, j, 1] = 0.5
-                    obs[i, j, 2] = 0.5
-
-                if (drone.view_range - 1 - i)*(drone.view_range - 1 - i)+(drone.view_range - 1 - j)*(drone.view_range - 1 - j) > drone.view_range*drone.view_range:
-                    obs[i, j, 0] = 0.5
-                    obs[i, j, 1] = 0.5
-                    obs[i, j, 2] = 0.5
-
-        return obs
+        x = drone.pos[0] - drone.view_range + 1 + self.view_pad
+        y = drone.pos[1] - drone.view_range + 1 + self.view_pad
+        code = self.get_scene_code()[x:x + obs_size, y:y + obs_size].copy()
+        code[self.get_view_mask(drone.view_range)] = 3
+        return DRONES_PALETTE[code]
+
+    def get_all_drone_obs(self):
+        # (drone_num, S, S, 3) observations of every drone, all drones must share one view_range
+        view_range = self.drone_list[0].view_range
+        obs_size = 2 * view_range - 1
+        corner = self.drone_pos - view_range + 1 + self.view_pad
+        rows = corner[:, 0, None] + np.arange(obs_size)
+        cols = corner[:, 1, None] + np.arange(obs_size)
+        code = self.get_scene_code()[rows[:, :, None], cols[:, None, :]]
+        code[:, self.get_view_mask(view_range)] = 3
+        return DRONES_PALETTE[code]
+
+    def blit_joint_obs(self, scene, x, y, w, h):
+        # repaint the padded joint observation over rows x:x+w, cols y:y+h from the scene and view coverage
+        seen = self.joint_cover[x:x + w, y:y + h] > 0
+        self.joint_obs[x:x + w, y:y + h] = DRONES_PALETTE[np.where(seen, scene[x:x + w, y:y + h], 3)]
 
     def get_joint_obs(self):
-        obs = np.ones((self.map_size, self.map_size, 3))
-        for i in range(self.map_size):
-            for j in range(self.map_size):
-                obs[i, j, 0] = 0.5
-                obs[i, j, 1] = 0.5
-                obs[i, j, 2] = 0.5
-        for k in range(self.drone_num):
-            temp = self.get_drone_obs(self.drone_list[k])
-            size = temp.shape[0]
-            for i in range(size):
-                for j in range(size):
-                    x = i + self.drone_list[k].pos[0] - self.drone_list[k].view_range + 1
-                    y = j + self.drone_list[k].pos[1] - self.drone_list[k].view_range + 1
-                    if_obs = True
-                    if temp[i, j, 0] == 0.5 and temp[i, j, 1] == 0.5 and temp[i, j, 2] == 0.5:
-                        if_obs = False
-                    if if_obs == True:
-                        obs[x, y, 0] = temp[i, j, 0]
-                        obs[x, y, 1] = temp[i, j, 1]
-                        obs[x, y, 2] = temp[i, j, 2]
-        return obs
+        # union of all drone views on a grey map, only windows of drones or humans that moved are repainted
+        scene = self.get_scene_code()
+        drone_pos = self.drone_pos.copy()
+        human_pos = self.scene_human_pos
+        first = self.joint_drone_pos is None
+        if first:
+            size = self.map_size + 2 * self.view_pad
+            self.joint_cover = np.zeros((size, size), dtype=np.int64)
+            self.joint_obs = np.empty((size, size, 3))
+            moved_drones = range(self.drone_num)
+        else:
+            moved_drones = np.nonzero(np.any(drone_pos != self.joint_drone_pos, axis=1))[0]
+
+        for k in moved_drones:
+            view_range = self.drone_list[k].view_range
+            obs_size = 2 * view_range - 1
+            disc = ~self.get_view_mask(view_range)
+            x, y = drone_pos[k] - view_range + 1 + self.view_pad
+            self.joint_cover[x:x + obs_size, y:y + obs_size] += disc
+            if not first:
+                old_x, old_y = self.joint_drone_pos[k] - view_range + 1 + self.view_pad
+                self.joint_cover[old_x:old_x + obs_size, old_y:old_y + obs_size] -= disc
+                # one blit over the box covering the old and new window, they mostly overlap
+                lo_x, lo_y = min(x, old_x), min(y, old_y)
+                self.blit_joint_obs(scene, lo_x, lo_y, max(x, old_x) + obs_size - lo_x, max(y, old_y) + obs_size - lo_y)
+
+        if first:
+            self.blit_joint_obs(scene, 0, 0, self.joint_obs.shape[0], self.joint_obs.shape[1])
+        else:
+            moved_humans = np.any(human_pos != self.joint_human_pos, axis=1)
+            if moved_humans.any():
+                cells = np.concatenate((self.joint_human_pos[moved_humans], human_pos[moved_humans])) + self.view_pad
+                seen = self.joint_cover[cells[:, 0], cells[:, 1]] > 0
+                code = np.where(seen, scene[cells[:, 0], cells[:, 1]], 3)
+                self.joint_obs[cells[:, 0], cells[:, 1]] = DRONES_PALETTE[code]
+
+        self.joint_drone_pos = drone_pos
+        self.joint_human_pos = human_pos
+        pad = self.view_pad
+        return self.joint_obs[pad:pad + self.map_size, pad:pad + self.map_size].copy()
 
     def rand_reset_drone_pos(self):
         for k in range(self.drone_num):
-            self.drone_list[k].pos = [random.randint(0, self.map_size-1), random.randint(0, self.map_size-1)]
+            self.drone_pos[k] = [random.randint(0, self.map_size-1), random.randint(0, self.map_size-1)]
 
     def drone_step(self, drone_act_list):
         if len(drone_act_list) != self.drone_num:
             return
-        for k in range(self.drone_num):
-            if drone_act_list[k] == 0:
-                if self.drone_list[k].pos[0] > 0:
-                    self.drone_list[k].pos[0] = self.drone_list[k].pos[0] - 1
-            elif drone_act_list[k] == 1:
-                if self.drone_list[k].pos[0] < self.map_size - 1:
-                    self.drone_list[k].pos[0] = self.drone_list[k].pos[0] + 1
-            elif drone_act_list[k] == 2:
-                if self.drone_list[k].pos[1] > 0:
-                    self.drone_list[k].pos[1] = self.drone_list[k].pos[1] - 1
-            elif drone_act_list[k] == 3:
-                if self.drone_list[k].pos[1] < self.map_size - 1:
-                    self.drone_list[k].pos[1] = self.drone_list[k].pos[1] + 1
+        # drones fly over everything and only stop at the map border
+        target = self.drone_pos + DRONES_MOVES[np.asarray(drone_act_list)]
+        np.clip(target, 0, self.map_size - 1, out=self.drone_pos)
 
     def human_step(self, human_act_list):
         if len(human_act_list) != self.human_num:
             return
-        for k in range(self.human_num):
-            if human_act_list[k] == 0:
-                if self.human_list[k].pos[0] > 0:
-                    free_space = self.land_mark_map[self.human_list[k].pos[0] - 1, self.human_list[k].pos[1]]
-                    if free_space == 0:
-                        self.human_list[k].pos[0] = self.human_list[k].pos[0] - 1
-            elif human_act_list[k] == 1:
-                if self.human_list[k].pos[0] < self.map_size - 1:
-                    free_space = self.land_mark_map[self.human_list[k].pos[0] + 1, self.human_list[k].pos[1]]
-                    if free_space == 0:
-                        self.human_list[k].pos[0] = self.human_list[k].pos[0] + 1
-            elif human_act_list[k] == 2:
-                if self.human_list[k].pos[1] > 0:
-                    free_space = self.land_mark_map[self.human_list[k].pos[0], self.human_list[k].pos[1] - 1]
-                    if free_space == 0:
-                        self.human_list[k].pos[1] = self.human_list[k].pos[1] - 1
-            elif human_act_list[k] == 3:
-                if self.human_list[k].pos[1] < self.map_size - 1:
-                    free_space = self.land_mark_map[self.human_list[k].pos[0], self.human_list[k].pos[1] + 1]
-                    if free_space == 0:
-                        self.human_list[k].pos[1] = self.human_list[k].pos[1] + 1
+        # humans stay inside the map and only walk onto free land (land mark 0)
+        target = np.clip(self.human_pos + DRONES_MOVES[np.asarray(human_act_list)], 0, self.map_size - 1)
+        free = self.land_mark_map[target[:, 0], target[:, 1]] == 0
+        self.human_pos[free] = target[free]
 
     def step(self, human_act_list, drone_act_list):
         self.drone_step(drone_act_list)
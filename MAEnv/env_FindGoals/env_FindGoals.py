@@ -1,9 +1,40 @@
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
-import cv2
+
+HEADLESS = os.environ.get('MAENV_HEADLESS', '0') != '0'
+
+# grid is 10 x 4, a cell (x, y) is stored at flat index x * 4 + y
+# action id -> flat cell offset: up, down, left, right, wait
+FIND_GOALS_DELTAS = np.array([1, -1, -4, 4, 0], dtype=np.int32)
+# per-agent cost of each action, agent 2 waits for free in EnvFindGoals.step
+FIND_GOALS_COSTS = np.array([[-1, -1, -1, -1, -1],
+                             [-1, -1, -1, -1, 0]], dtype=np.int32)
+FIND_GOALS_OCCUPANCY = np.array([[1, 1, 1, 1],
+                                 [1, 1, 0, 1],
+                                 [1, 1, 0, 1],
+                                 [1, 1, 0, 1],
+                                 [1, 1, 0, 1],
+                                 [1, 1, 0, 1],
+                                 [1, 1, 0, 1],
+                                 [1, 1, 0, 1],
+                                 [1, 1, 0, 1],
+                                 [1, 1, 1, 1]], dtype=np.int8)
+FIND_GOALS_STARTS = np.array([3 * 4 + 1, 6 * 4 + 1], dtype=np.int32)
+FIND_GOALS_DESTS = np.array([8 * 4 + 2, 1 * 4 + 2], dtype=np.int32)
+# flat offset seen by cell [row, col] of a 3x3 observation: (x + col - 1, y + 1 - row)
+FIND_GOALS_WINDOW = np.array([[-3, 1, 5],
+                              [-4, 0, 4],
+                              [-5, -1, 3]], dtype=np.int32)
+# cell codes used to paint observations: free, wall, agent 1 (red), agent 2 (blue)
+FIND_GOALS_PALETTE = np.array([[1.0, 1.0, 1.0],
+                               [0.0, 0.0, 0.0],
+                               [1.0, 0.0, 0.0],
+                               [0.0, 0.0, 1.0]])
+
 
 class EnvFindGoals(object):
+    # 3x3 wall tiles keyed by agent position, shared by all instances since the map never changes
+    obs_tiles = {}
 
     def __init__(self):
         self.start1 = [3, 1]
@@ -27,173 +58,43 @@ class EnvFindGoals(object):
         c = [a[i] + b[i] for i in range(min(len(a), len(b)))]
         return c
 
-    def get_agt1_obs(self):
-        visual_range = 3
-        vec = np.zeros((visual_range, visual_range, 3))
-
-        for i in range(visual_range):
-            for j in range(visual_range):
-                vec[i, j, 0] = 1.0
-                vec[i, j, 1] = 1.0
-                vec[i, j, 2] = 1.0
-
-        # detect block
-        if self.occupancy[self.agt1_pos[0] - 1][self.agt1_pos[1] + 1] == 1:
-            vec[0, 0, 0] = 0.0
-            vec[0, 0, 1] = 0.0
-            vec[0, 0, 2] = 0.0
-        if self.occupancy[self.agt1_pos[0]][self.agt1_pos[1] + 1] == 1:
-            vec[0, 1, 0] = 0.0
-            vec[0, 1, 1] = 0.0
-            vec[0, 1, 2] = 0.0
-        if self.occupancy[self.agt1_pos[0] + 1][self.agt1_pos[1] + 1] == 1:
-            vec[0, 2, 0] = 0.0
-            vec[0, 2, 1] = 0.0
-            vec[0, 2, 2] = 0.0
-        if self.occupancy[self.agt1_pos[0] - 1][self.agt1_pos[1]] == 1:
-            vec[1, 0, 0] = 0.0
-            vec[1, 0, 1] = 0.0
-            vec[1, 0, 2] = 0.0
-        if self.occupancy[self.agt1_pos[0] + 1][self.agt1_pos[1]] == 1:
-            vec[1, 2, 0] = 0.0
-            vec[1, 2, 1] = 0.0
-            vec[1, 2, 2] = 0.0
-        if self.occupancy[self.agt1_pos[0] - 1][self.agt1_pos[1] - 1] == 1:
-            vec[2, 0, 0] = 0.0
-            vec[2, 0, 1] = 0.0
-            vec[2, 0, 2] = 0.0
-        if self.occupancy[self.agt1_pos[0]][self.agt1_pos[1] - 1] == 1:
-            vec[2, 1, 0] = 0.0
-            vec[2, 1, 1] = 0.0
-            vec[2, 1, 2] = 0.0
-        if self.occupancy[self.agt1_pos[0] + 1][self.agt1_pos[1] - 1] == 1:
-            vec[2, 2, 0] = 0.0
-            vec[2, 2, 1] = 0.0
-            vec[2, 2, 2] = 0.0
+    def get_obs_tile(self, pos):
+        # walls seen from pos, the start cells are left open since they are only walls while an agent stands there
+        key = (pos[0], pos[1])
+        if key not in self.obs_tiles:
+            cells = pos[0] * 4 + pos[1] + FIND_GOALS_WINDOW
+            code = FIND_GOALS_OCCUPANCY.reshape(-1)[cells]
+            code[np.isin(cells, FIND_GOALS_STARTS)] = 0
+            self.obs_tiles[key] = FIND_GOALS_PALETTE[code]
+        return self.obs_tiles[key]
+
+    def get_agt_obs(self, agt_id, out=None):
+        # out: optional (3, 3, 3) float array to fill instead of allocating a new one
+        if agt_id == 0:
+            pos, other = self.agt1_pos, self.agt2_pos
+        else:
+            pos, other = self.agt2_pos, self.agt1_pos
+        tile = self.get_obs_tile(pos)
+        if out is None:
+            out = tile.copy()
+        else:
+            out[...] = tile
 
         # detect self
-        vec[1, 1, 0] = 1.0
-        vec[1, 1, 1] = 0.0
-        vec[1, 1, 2] = 0.0
-
-        # detect agent2
-        if self.agt2_pos == self.list_add(self.agt1_pos, [-1, 1]):
-            vec[0, 0, 0] = 0.0
-            vec[0, 0, 1] = 0.0
-            vec[0, 0, 2] = 1.0
-        if self.agt2_pos == self.list_add(self.agt1_pos, [0, 1]):
-            vec[0, 1, 0] = 0.0
-            vec[0, 1, 1] = 0.0
-            vec[0, 1, 2] = 1.0
-        if self.agt2_pos == self.list_add(self.agt1_pos, [1, 1]):
-            vec[0, 2, 0] = 0.0
-            vec[0, 2, 1] = 0.0
-            vec[0, 2, 2] = 1.0
-        if self.agt2_pos == self.list_add(self.agt1_pos, [-1, 0]):
-            vec[1, 0, 0] = 0.0
-            vec[1, 0, 1] = 0.0
-            vec[1, 0, 2] = 1.0
-        if self.agt2_pos == self.list_add(self.agt1_pos, [1, 0]):
-            vec[1, 2, 0] = 0.0
-            vec[1, 2, 1] = 0.0
-            vec[1, 2, 2] = 1.0
-        if self.agt2_pos == self.list_add(self.agt1_pos, [-1, -1]):
-            vec[2, 0, 0] = 0.0
-            vec[2, 0, 1] = 0.0
-            vec[2, 0, 2] = 1.0
-        if self.agt2_pos == self.list_add(self.agt1_pos, [0, -1]):
-            vec[2, 1, 0] = 0.0
-            vec[2, 1, 1] = 0.0
-            vec[2, 1, 2] = 1.0
-        if self.agt2_pos == self.list_add(self.agt1_pos, [1, -1]):
-            vec[2, 2, 0] = 0.0
-            vec[2, 2, 1] = 0.0
-            vec[2, 2, 2] = 1.0
-        return vec
+        out[1, 1] = FIND_GOALS_PALETTE[2 + agt_id]
 
-    def get_agt2_obs(self):
-        visual_range = 3
-        vec = np.zeros((visual_range, visual_range, 3))
-
-        for i in range(visual_range):
-            for j in range(visual_range):
-                vec[i, j, 0] = 1.0
-                vec[i, j, 1] = 1.0
-                vec[i, j, 2] = 1.0
-
-        # detect block
-        if self.occupancy[self.agt2_pos[0] - 1][self.agt2_pos[1] + 1] == 1:
-            vec[0, 0, 0] = 0.0
-            vec[0, 0, 1] = 0.0
-            vec[0, 0, 2] = 0.0
-        if self.occupancy[self.agt2_pos[0]][self.agt2_pos[1] + 1] == 1:
-            vec[0, 1, 0] = 0.0
-            vec[0, 1, 1] = 0.0
-            vec[0, 1, 2] = 0.0
-        if self.occupancy[self.agt2_pos[0] + 1][self.agt2_pos[1] + 1] == 1:
-            vec[0, 2, 0] = 0.0
-            vec[0, 2, 1] = 0.0
-            vec[0, 2, 2] = 0.0
-        if self.occupancy[self.agt2_pos[0] - 1][self.agt2_pos[1]] == 1:
-            vec[1, 0, 0] = 0.0
-            vec[1, 0, 1] = 0.0
-            vec[1, 0, 2] = 0.0
-        if self.occupancy[self.agt2_pos[0] + 1][self.agt2_pos[1]] == 1:
-            vec[1, 2, 0] = 0.0
-            vec[1, 2, 1] = 0.0
-            vec[1, 2, 2] = 0.0
-        if self.occupancy[self.agt2_pos[0] - 1][self.agt2_pos[1] - 1] == 1:
-            vec[2, 0, 0] = 0.0
-            vec[2, 0, 1] = 0.0
-            vec[2, 0, 2] = 0.0
-        if self.occupancy[self.agt2_pos[0]][self.agt2_pos[1] - 1] == 1:
-            vec[2, 1, 0] = 0.0
-            vec[2, 1, 1] = 0.0
-            vec[2, 1, 2] = 0.0
-        if self.occupancy[self.agt2_pos[0] + 1][self.agt2_pos[1] - 1] == 1:
-            vec[2, 2, 0] = 0.0
-            vec[2, 2, 1] = 0.0
-            vec[2, 2, 2] = 0.0
+        # detect the other agent
+        dx = other[0] - pos[0]
+        dy = other[1] - pos[1]
+        if -1 <= dx <= 1 and -1 <= dy <= 1 and (dx != 0 or dy != 0):
+            out[1 - dy, 1 + dx] = FIND_GOALS_PALETTE[3 - agt_id]
+        return out
 
-        # detect self
-        vec[1, 1, 0] = 0.0
-        vec[1, 1, 1] = 0.0
-        vec[1, 1, 2] = 1.0
-
-        # detect agent2
-        if self.agt1_pos == self.list_add(self.agt2_pos, [-1, 1]):
-            vec[0, 0, 0] = 1.0
-            vec[0, 0, 1] = 0.0
-            vec[0, 0, 2] = 0.0
-        if self.agt1_pos == self.list_add(self.agt2_pos, [0, 1]):
-            vec[0, 1, 0] = 1.0
-            vec[0, 1, 1] = 0.0
-            vec[0, 1, 2] = 0.0
-        if self.agt1_pos == self.list_add(self.agt2_pos, [1, 1]):
-            vec[0, 2, 0] = 1.0
-            vec[0, 2, 1] = 0.0
-            vec[0, 2, 2] = 0.0
-        if self.agt1_pos == self.list_add(self.agt2_pos, [-1, 0]):
-            vec[1, 0, 0] = 1.0
-            vec[1, 0, 1] = 0.0
-            vec[1, 0, 2] = 0.0
-        if self.agt1_pos == self.list_add(self.agt2_pos, [1, 0]):
-            vec[1, 2, 0] = 1.0
-            vec[1, 2, 1] = 0.0
-            vec[1, 2, 2] = 0.0
-        if self.agt1_pos == self.list_add(self.agt2_pos, [-1, -1]):
-            vec[2, 0, 0] = 1.0
-            vec[2, 0, 1] = 0.0
-            vec[2, 0, 2] = 0.0
-        if self.agt1_pos == self.list_add(self.agt2_pos, [0, -1]):
-            vec[2, 1, 0] = 1.0
-            vec[2, 1, 1] = 0.0
-            vec[2, 1, 2] = 0.0
-        if self.agt1_pos == self.list_add(self.agt2_pos, [1, -1]):
-            vec[2, 2, 0] = 1.0
-            vec[2, 2, 1] = 0.0
-            vec[2, 2, 2] = 0.0
-        return vec
+    def get_agt1_obs(self, out=None):
+        return self.get_agt_obs(0, out)
+
+    def get_agt2_obs(self, out=None):
+        return self.get_agt_obs(1, out)
 
     def get_full_obs(self):
         obs = np.ones((4, 10, 3))
@@ -326,6 +227,10 @@ class EnvFindGoals(object):
                           [1, 1, 1, 1]]
 
     def plot_scene(self):
+        if HEADLESS:
+            return
+        import matplotlib.pyplot as plt
+        from matplotlib.gridspec import GridSpec
         fig = plt.figure(figsize=(5, 5))
         gs = GridSpec(3, 2, figure=fig)
         ax1 = fig.add_subplot(gs[0:2, 0:2])
@@ -344,6 +249,9 @@ class EnvFindGoals(object):
         plt.show()
 
     def render(self):
+        if HEADLESS:
+            return
+        import cv2
         obs = np.ones((4 * 20, 10 * 20, 3))
         for i in range(10):
             for j in range(4):
@@ -353,3 +261,92 @@ class EnvFindGoals(object):
         cv2.rectangle(obs, (self.agt1_pos[0] * 20, (3-self.agt1_pos[1]) * 20), (self.agt1_pos[0] * 20 + 20, (3-self.agt1_pos[1]) * 20 + 20), (0, 0, 255), -1)
         cv2.imshow('image', obs)
         cv2.waitKey(10)
+
+
+class EnvFindGoalsBatch(object):
+    # n_envs independent copies of EnvFindGoals stepped together, worlds that finish are reset in place
+
+    def __init__(self, n_envs):
+        self.n_envs = n_envs
+        self.env_idx = np.arange(n_envs)
+        self.base = (self.env_idx * 40).astype(np.int32)
+        self.agt_cell = np.zeros((n_envs, 2), dtype=np.int32)
+        self.occupancy = np.zeros((n_envs, 10, 4), dtype=np.int8)
+        self.occ_flat = self.occupancy.reshape(-1)
+        self.reset()
+
+    @property
+    def agt_pos(self):
+        # (n_envs, 2, 2) array of [x, y] per agent
+        return np.stack(np.divmod(self.agt_cell, 4), axis=-1)
+
+    def reset(self, mask=None):
+        if mask is None:
+            mask = np.ones(self.n_envs, dtype=bool)
+        self.agt_cell[mask] = FIND_GOALS_STARTS
+        self.occupancy[mask] = FIND_GOALS_OCCUPANCY
+
+    def step(self, actions):
+        # actions: (n_envs, 2) ints in [0, 4], returns (reward, done) as (n_envs,) arrays
+        actions = np.asarray(actions)
+        occ = self.occ_flat
+        reward = np.zeros(self.n_envs, dtype=np.int32)
+        # agents move one after the other, agent 2 sees the cell agent 1 just entered
+        for k in range(2):
+            act = actions[:, k]
+            cell = self.base + self.agt_cell[:, k]
+            target = cell + FIND_GOALS_DELTAS[act]
+            is_move = act < 4
+            blocked = is_move & (occ[target] == 1)
+            move = is_move & ~blocked
+            occ[cell] &= ~move
+            occ[target] |= move
+            self.agt_cell[:, k] += FIND_GOALS_DELTAS[act] * move
+            reward += FIND_GOALS_COSTS[k][act] - 3 * blocked
+
+        done = self.agt_cell[:, 0] == FIND_GOALS_DESTS[0]
+        for k in range(2):
+            arrived = done if k == 0 else self.agt_cell[:, 1] == FIND_GOALS_DESTS[1]
+            occ[self.base + FIND_GOALS_DESTS[k]] &= ~arrived
+            occ[self.base + FIND_GOALS_STARTS[k]] |= arrived
+            self.agt_cell[arrived, k] = FIND_GOALS_STARTS[k]
+            reward += 50 * arrived
+
+        if done.any():
+            self.reset(done)
+        return reward, done
+
+    def get_obs_code(self, agt_id):
+        # (n_envs, 3, 3) palette codes of the window around agent agt_id
+        cell = self.agt_cell[:, agt_id]
+        code = self.occ_flat[(self.base + cell)[:, None, None] + FIND_GOALS_WINDOW]
+        code[:, 1, 1] = 2 + agt_id
+        x, y = np.divmod(cell, 4)
+        other_x, other_y = np.divmod(self.agt_cell[:, 1 - agt_id], 4)
+        dx, dy = other_x - x, other_y - y
+        near = (np.abs(dx) <= 1) & (np.abs(dy) <= 1) & ((dx != 0) | (dy != 0))
+        code[self.env_idx[near], 1 - dy[near], 1 + dx[near]] = 3 - agt_id
+        return code
+
+    def get_agt_obs(self, agt_id):
+        # (n_envs, 3, 3, 3), same layout as EnvFindGoals.get_agt1_obs / get_agt2_obs
+        return np.take(FIND_GOALS_PALETTE, self.get_obs_code(agt_id), axis=0)
+
+    def get_agt1_obs(self):
+        return self.get_agt_obs(0)
+
+    def get_agt2_obs(self):
+        return self.get_agt_obs(1)
+
+    def get_obs(self):
+        # (n_envs, 2, 3, 3, 3)
+        code = np.stack([self.get_obs_code(0), self.get_obs_code(1)], axis=1)
+        return np.take(FIND_GOALS_PALETTE, code, axis=0)
+
+    def get_full_obs(self):
+        # (n_envs, 4, 10, 3), same layout as EnvFindGoals.get_full_obs
+        code = self.occupancy[:, :, ::-1].transpose(0, 2, 1).copy()
+        for k in range(2):
+            x, y = np.divmod(self.agt_cell[:, k], 4)
+            code[self.env_idx, 3 - y, x] = 2 + k
+        return np.take(FIND_GOALS_PALETTE, code, axis=0)
@@ -1,7 +1,7 @@
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
-import cv2
+
+HEADLESS = os.environ.get('MAENV_HEADLESS', '0') != '0'
 
 class EnvFindTreasure(object):
     def __init__(self, map_size):
@@ -246,6 +246,10 @@ class EnvFindTreasure(object):
         return state
 
     def plot_scene(self):
+        if HEADLESS:
+            return
+        import matplotlib.pyplot as plt
+        from matplotlib.gridspec import GridSpec
         fig = plt.figure(figsize=(5, 5))
         gs = GridSpec(3, 2, figure=fig)
         ax1 = fig.add_subplot(gs[0:2, 0:2])
@@ -265,6 +269,9 @@ class EnvFindTreasure(object):
         plt.show()
 
     def render(self):
+        if HEADLESS:
+            return
+        import cv2
 
         obs = self.get_global_obs()
         enlarge = 30
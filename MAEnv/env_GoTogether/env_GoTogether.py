@@ -1,8 +1,8 @@
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
 import random
-import cv2
+
+HEADLESS = os.environ.get('MAENV_HEADLESS', '0') != '0'
 
 class EnvGoTogether(object):
     def __init__(self, size):
@@ -99,6 +99,9 @@ class EnvGoTogether(object):
         return obs
 
     def plot_scene(self):
+        if HEADLESS:
+            return
+        import matplotlib.pyplot as plt
         plt.figure(figsize=(5, 5))
         plt.imshow(self.get_global_obs())
         plt.xticks([])
@@ -106,6 +109,9 @@ class EnvGoTogether(object):
         plt.show()
 
     def render(self):
+        if HEADLESS:
+            return
+        import cv2
         obs = self.get_global_obs()
         enlarge = 30
         new_obs = np.ones((self.map_size*enlarge, self.map_size*enlarge, 3))
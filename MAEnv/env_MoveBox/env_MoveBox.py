@@ -1,8 +1,8 @@
+import os
 import numpy as np
 import random
-import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
-import cv2
+
+HEADLESS = os.environ.get('MAENV_HEADLESS', '0') != '0'
 
 class EnvMoveBox(object):
     def __init__(self):
@@ -252,6 +252,10 @@ class EnvMoveBox(object):
         return [self.get_agt1_obs(), self.get_agt2_obs()]
 
     def plot_scene(self):
+        if HEADLESS:
+            return
+        import matplotlib.pyplot as plt
+        from matplotlib.gridspec import GridSpec
         fig = plt.figure(figsize=(5, 5))
         gs = GridSpec(2, 2, figure=fig)
         ax1 = fig.add_subplot(gs[0, 0])
@@ -273,6 +277,9 @@ class EnvMoveBox(object):
         plt.show()
 
     def render(self):
+        if HEADLESS:
+            return
+        import cv2
         obs = np.ones((15 * 20, 15 * 20, 3))
         for i in range(15):
             for j in range(15):
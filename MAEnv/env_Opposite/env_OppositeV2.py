@@ -1,8 +1,8 @@
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
 import random
-import cv2
+
+HEADLESS = os.environ.get('MAENV_HEADLESS', '0') != '0'
 
 class EnvOppositeV2(object):
     def __init__(self, size):
@@ -194,6 +194,9 @@ class EnvOppositeV2(object):
         return obs
 
     def render(self):
+        if HEADLESS:
+            return
+        import cv2
         obs = self.get_global_obs()
         enlarge = 30
         new_obs = np.ones((self.map_size*enlarge, self.map_size*enlarge, 3))
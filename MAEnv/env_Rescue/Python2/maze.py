@@ -7,10 +7,182 @@ algorithm to generate a randomized mazes!
 	@author: Paul Miller (github.com/138paulmiller)
 '''
 import numpy as np
+import collections
 import os, sys, random, time, threading
 # defined in disjointSet.py
 import disjointSet as ds
 
+# layout version used by default: 1 reproduces Maze.kruskalize for every seed,
+# 2 shuffles the edges with a numpy Generator permutation instead
+MAZE_VERSION = 1
+
+def kruskal_edges(width, height, seed, version=MAZE_VERSION):
+	'''
+	Edges between neighbouring cells in the order the randomized Kruskal takes them.
+	Cells are keyed width*row + col like Maze.grid, edges are enumerated like
+	Maze.kruskalize (per cell, the left edge then the edge to the previous row).
+	@params
+		width(int)	: number of columns
+		height(int)	: number of rows
+		seed(float)	: number to seed RNG
+		version(int)	: layout version, see MAZE_VERSION
+	@return
+		(numpy array, numpy array) : keys of the two cells of each edge
+	'''
+	col, row = np.meshgrid(np.arange(width), np.arange(height))
+	key = width*row + col
+	valid = np.stack([col > 0, row > 0], axis=-1)
+	edge_a = np.stack([key - 1, key - width], axis=-1)[valid]
+	edge_b = np.stack([key, key], axis=-1)[valid]
+	if version == 1:
+		# same draws as kruskalize, which pops random edges into a list and then takes them from its end
+		rng = random.Random(seed)
+		remaining = list(range(len(edge_a)))
+		order = []
+		while len(remaining) > 0:
+			order.append(remaining.pop(rng.randint(0, len(remaining))-1))
+		order = np.array(order[::-1], dtype=np.int64)
+	elif version == 2:
+		order = np.random.default_rng(seed).permutation(len(edge_a))
+	else:
+		raise ValueError('unknown maze version %s' % version)
+	return edge_a[order], edge_b[order]
+
+def find_root(parent, key):
+	'''
+	Root of the set containing key, every node on the way is pointed at the root.
+	@params
+		parent(numpy array) : parent of each key, roots are their own parent
+		key(int)	: key of the element
+	@return
+		int	: key of the root
+	'''
+	root = key
+	while parent[root] != root:
+		root = parent[root]
+	while parent[key] != root:
+		parent[key], key = root, parent[key]
+	return root
+
+def grid_from_walls(wall_v, wall_h):
+	'''
+	Occupancy grid of a maze given the walls between its cells.
+	Cell (row, col) sits at (2*row+1, 2*col+1), walls and corners in between.
+	@params
+		wall_v(numpy array) : (height, width-1) bools, wall between (row, col) and (row, col+1)
+		wall_h(numpy array) : (height-1, width) bools, wall between (row, col) and (row+1, col)
+	@return
+		numpy array	: (2*height+1, 2*width+1) grid, 1 wall and 0 free
+	'''
+	height, width = wall_v.shape[0], wall_h.shape[1]
+	grid = np.ones((2*height+1, 2*width+1), dtype=int)
+	grid[1::2, 1::2] = 0
+	grid[1:-1:2, 2:-1:2] = wall_v
+	grid[2:-1:2, 1::2] = wall_h
+	return grid
+
+def grid_from_edges(width, height, edge_a, edge_b):
+	'''
+	Occupancy grid of a maze whose open passages are the given edges.
+	@params
+		width(int)	: number of columns
+		height(int)	: number of rows
+		edge_a, edge_b(numpy array) : keys (width*row + col) of the two cells of each passage
+	@return
+		numpy array	: (2*height+1, 2*width+1) grid, 1 wall and 0 free
+	'''
+	low, high = np.minimum(edge_a, edge_b), np.maximum(edge_a, edge_b)
+	same_row = low//width == high//width
+	wall_v = np.ones((height, width-1), dtype=bool)
+	wall_h = np.ones((height-1, width), dtype=bool)
+	wall_v[low[same_row]//width, low[same_row]%width] = False
+	wall_h[low[~same_row]//width, low[~same_row]%width] = False
+	return grid_from_walls(wall_v, wall_h)
+
+def kruskal_grid(width, height, seed, version=MAZE_VERSION):
+	'''
+	Occupancy grid of a randomized Kruskal maze without building a Maze object.
+	Union-find over int32 parent and rank arrays, the same edges are kept as in
+	Maze.kruskalize so version 1 equals Maze(width, height, seed, ...).to_np().
+	@params
+		width(int)	: number of columns
+		height(int)	: number of rows
+		seed(float)	: number to seed RNG
+		version(int)	: layout version, see MAZE_VERSION
+	@return
+		numpy array	: (2*height+1, 2*width+1) grid, 1 wall and 0 free
+	'''
+	edge_a, edge_b = kruskal_edges(width, height, seed, version)
+	parent = np.arange(width*height, dtype=np.int32)
+	rank = np.zeros(width*height, dtype=np.int32)
+	kept = np.zeros(len(edge_a), dtype=bool)
+	edge_count = 0
+	for i, (key_a, key_b) in enumerate(zip(edge_a.tolist(), edge_b.tolist())):
+		if edge_count == width*height - 1:
+			break
+		root_a = find_root(parent, key_a)
+		root_b = find_root(parent, key_b)
+		if root_a != root_b:
+			kept[i] = True
+			edge_count += 1
+			if rank[root_a] < rank[root_b]:
+				parent[root_a] = root_b
+			elif rank[root_a] > rank[root_b]:
+				parent[root_b] = root_a
+			else:
+				parent[root_b] = root_a
+				rank[root_a] += 1
+	return grid_from_edges(width, height, edge_a[kept], edge_b[kept])
+
+# occupancy grids already built in this process, keyed by (width, height, seed, version), least recently used first
+GRID_CACHE = collections.OrderedDict()
+GRID_CACHE_SIZE = 64
+
+def cached_grid(width, height, seed, cache_dir=None, version=MAZE_VERSION):
+	'''
+	Occupancy grid of the maze fully determined by (width, height, seed, version).
+	Grids are kept in an in-process LRU cache and, if cache_dir or the
+	MAZE_CACHE_DIR environment variable is set, in .npy files there so
+	other processes load them instead of running Kruskal again.
+	@params
+		width(int)	: number of columns
+		height(int)	: number of rows
+		seed(float)	: number to seed RNG
+		cache_dir(str)	: optional directory of the on-disk store
+		version(int)	: layout version, see MAZE_VERSION
+	@return
+		numpy array	: read-only (2*height+1, 2*width+1) grid, 1 wall and 0 free, copy before modifying
+	'''
+	key = (width, height, seed, version)
+	if key in GRID_CACHE:
+		grid = GRID_CACHE.pop(key)
+		GRID_CACHE[key] = grid
+		return grid
+	cache_dir = cache_dir or os.environ.get('MAZE_CACHE_DIR')
+	path = None
+	grid = None
+	if cache_dir:
+		path = os.path.join(cache_dir, 'maze_%dx%d_%s_v%d.npy' % key)
+		if os.path.exists(path):
+			grid = np.load(path)
+	if grid is None:
+		grid = kruskal_grid(width, height, seed, version)
+		if path is not None:
+			try:
+				os.makedirs(cache_dir)
+			except OSError:
+				pass
+			# write then rename, so a process loading the same maze never sees a partial file
+			tmp = '%s.%d.tmp' % (path, os.getpid())
+			with open(tmp, 'wb') as f:
+				np.save(f, grid)
+			os.rename(tmp, path)
+	grid.setflags(write=False)
+	GRID_CACHE[key] = grid
+	while len(GRID_CACHE) > GRID_CACHE_SIZE:
+		GRID_CACHE.popitem(last=False)
+	return grid
+
 class Maze:
 	# static variables
 	# Directions to move the player. 
@@ -126,52 +298,25 @@ class Maze:
 		return s
 
 	def to_np(self):
-		s = np.zeros((2*self.height+1, 2*self.width+1), dtype=np.int)
-		print(s.shape)
-		for col in range(0, 2*self.width+1):
-			s[0][col] = 1
-		for row in range(0, self.height):
-			s[2*row + 1][0] = 1
-			s[2*row + 1][1] = 0
-			for col in range(1, self.width):
-				if self.grid[col-1][row] in self.portals[self.grid[col][row]]:
-					# if portal remove wall
-					s[2*row+1][2*col] = 0
-				else:
-					# if not portal draw vertical wall
-					s[2*row+1][2*col] = 1
-				# if at [width-1][height-1] draw end marker or cell
-				if row == self.height-1 and col == self.width-1:
-					s[2*row+1][2*col+1] = 0
-			s[2*row+1][2*self.width] = 1
-			for col in range(0, self.width):
-				# if edge above (visually below)
-				c = 1
-				key = self.grid[col][row]
-				# if not at last row, and theres a portal between cell and above cell
-				if row+1 < self.height and self.grid[col][row+1] in self.portals[key]:
-						c = 0
-				s[2*row+2][2*col] = 1
-				if c == 1:
-					s[2 * row + 2][2 * col + 1] = 1
-				else:
-					s[2 * row + 2][2 * col + 1] = 0
-			s[2*row+2][-1] = 1
-		return s
+		'''
+		Occupancy grid of the maze, 1 wall and 0 free.
+		@return
+			numpy array	: (2*height+1, 2*width+1) grid
+		'''
+		pairs = [(key, near) for key, portals in self.portals.items() for near in portals]
+		pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+		return grid_from_edges(self.width, self.height, pairs[:, 0], pairs[:, 1])
 
 	def scale(self, map_np):
-		new_map_np = np.zeros((self.scaling * map_np.shape[0], self.scaling * map_np.shape[1]))
-		for i in range(map_np.shape[0]):
-			for j in range(map_np.shape[1]):
-				if map_np[i][j] == 1:
-					for k in range(self.scaling):
-						for l in range(self.scaling):
-							new_map_np[self.scaling * i + k][self.scaling * j + l] = 1
-				else:
-					for k in range(self.scaling):
-						for l in range(self.scaling):
-							new_map_np[self.scaling * i + k][self.scaling * j + l] = 0
-		return new_map_np
+		'''
+		Upsamples a grid so every cell becomes a scaling x scaling block.
+		@params
+			map_np(numpy array) : grid to scale, 1 wall
+		@return
+			numpy array	: scaled grid of floats, 1 wall and 0 free
+		'''
+		block = np.ones((self.scaling, self.scaling))
+		return np.kron(map_np == 1, block)
 
 
 	def portals_str(self):
@@ -1,7 +1,8 @@
 from CEnvRescue import CEnvRescue
+import _CEnvRescue
+from rescue_obs import ObsReader
 import numpy as np
 import maze
-import matplotlib.pyplot as plt
 import random
 
 class EnvRescue(object):
@@ -10,51 +11,35 @@ class EnvRescue(object):
         self.generate_maze(seed)
         self.N_agent = N_agent
         self.N_human = N_human
-        self.cenv = CEnvRescue(random.randint(0, 10000), self.N_agent, self.N_human)
+        self.cenv = CEnvRescue(random.Random(seed).randint(0, 10000), self.N_agent, self.N_human)
         self.edge_blk_num = self.cenv.edge_blk_num
+        self.obs_reader = ObsReader(self.cenv)
+        # bounds of d_x, d_y, omega and if_pick
+        self.action_low = np.array([-0.5, -0.5, -10, -np.inf])
+        self.action_high = np.array([0.5, 0.5, 10, np.inf])
+        self.rescued_num = self.get_rescued_human_num()
 
     def generate_maze(self, seed):
-        symbols = {
-            # default symbols
-            'start': 'S',
-            'end': 'X',
-            'wall_v': '|',
-            'wall_h': '-',
-            'wall_c': '+',
-            'head': '#',
-            'tail': 'o',
-            'empty': ' '
-        }
-        maze_obj = maze.Maze(int((self.map_size-1)/2), int((self.map_size-1)/2), seed, symbols, 1)
-        grid_map = maze_obj.to_np()
+        grid_map = maze.cached_grid(int((self.map_size-1)/2), int((self.map_size-1)/2), seed)
         print('generate map with size', grid_map.shape[0], grid_map.shape[1])
         np.savetxt("map.csv", grid_map, fmt = "%d", delimiter=",")
 
     def step(self, action_list):
-        for i in range(self.N_agent):
-            if action_list[i][0]>0.5:
-                action_list[i][0]=0.5
-            if action_list[i][0]<-0.5:
-                action_list[i][0]=-0.5
-            self.cenv.d_x = action_list[i][0]
-
-            if action_list[i][1]>0.5:
-                action_list[i][1]=0.5
-            if action_list[i][1]<-0.5:
-                action_list[i][1]=-0.5
-            self.cenv.d_y = action_list[i][1]
-
-
-            if action_list[i][2]>10:
-                action_list[i][2]=10
-            if action_list[i][2]<-10:
-                action_list[i][2]=-10
-            self.cenv.omega = action_list[i][2]
-
-            self.cenv.if_pick = action_list[i][3]
-
-
-            self.cenv.step(i)
+        # action_list: (N_agent, 4) rows of d_x, d_y, omega, if_pick, clipped to their bounds
+        # returns each agent's reward, the team's count of humans newly brought to safety, and the (N_agent, 2) agent positions
+        actions = np.clip(np.asarray(action_list, dtype=float), self.action_low, self.action_high)
+        # the binding takes one agent per call, the raw setters skip the proxy's attribute lookup
+        this = self.cenv.this
+        for i, (d_x, d_y, omega, if_pick) in enumerate(actions.tolist()):
+            _CEnvRescue.CEnvRescue_d_x_set(this, d_x)
+            _CEnvRescue.CEnvRescue_d_y_set(this, d_y)
+            _CEnvRescue.CEnvRescue_omega_set(this, omega)
+            _CEnvRescue.CEnvRescue_if_pick_set(this, int(if_pick))
+            _CEnvRescue.CEnvRescue_step(this, i)
+        rescued_num = self.get_rescued_human_num()
+        reward = np.full(self.N_agent, float(rescued_num - self.rescued_num))
+        self.rescued_num = rescued_num
+        return reward, self.get_all_agent_pos()
 
     def get_obs(self):
         obs_list = []
@@ -62,22 +47,25 @@ class EnvRescue(object):
             obs_list.append(self.get_agt_obs(i))
         return obs_list
 
-    def get_agt_obs(self, agt_id):
-        self.cenv.init_obs(agt_id)
-        obs = np.zeros((1,self.cenv.obs_size*self.cenv.obs_size*3))
-        for i in range(self.cenv.obs_size*self.cenv.obs_size*3):
-            self.cenv.get_obs(agt_id, i)
-            obs[0, i] = self.cenv.obs
-        obs = obs.reshape((self.cenv.obs_size, self.cenv.obs_size, 3))
-        return obs
+    def get_agt_obs(self, agt_id, out=None):
+        # out: optional (obs_size, obs_size, 3) array the obs is written into
+        if out is None:
+            out = np.zeros((self.cenv.obs_size, self.cenv.obs_size, 3))
+        return self.obs_reader.agent_obs(agt_id, out)
 
-    def get_global_obs(self):
-        self.cenv.init_global_obs()
-        obs = np.zeros((1,self.cenv.edge_blk_num*self.cenv.edge_blk_num*3))
-        for i in range(self.cenv.edge_blk_num*self.cenv.edge_blk_num*3):
-            self.cenv.get_global_obs(i)
-            obs[0, i] = self.cenv.global_obs
-        obs = obs.reshape((self.cenv.edge_blk_num, self.cenv.edge_blk_num, 3))
+    def get_all_agent_obs(self, out=None):
+        # obs of every agent stacked into one (N_agent, obs_size, obs_size, 3) array
+        if out is None:
+            out = np.zeros((self.N_agent, self.cenv.obs_size, self.cenv.obs_size, 3))
+        for i in range(self.N_agent):
+            self.obs_reader.agent_obs(i, out[i])
+        return out
+
+    def get_global_obs(self, out=None):
+        # out: optional (edge_blk_num, edge_blk_num, 3) array the obs is written into
+        if out is None:
+            out = np.zeros((self.edge_blk_num, self.edge_blk_num, 3))
+        obs = self.obs_reader.global_obs(out)
         for i in range(self.N_agent):
             agt_pos = self.get_agent_pos(i)
             agt_pos = self.real_pos_to_img_pos(agt_pos)
@@ -92,32 +80,8 @@ class EnvRescue(object):
         return obs
 
     def get_real_obs(self):
-        self.cenv.init_global_obs()
-        obs = np.zeros((1, self.cenv.edge_blk_num*self.cenv.edge_blk_num*3))
-        for i in range(self.cenv.edge_blk_num*self.cenv.edge_blk_num*3):
-            self.cenv.get_global_obs(i)
-            obs[0, i] = self.cenv.global_obs
-        obs = obs.reshape((self.cenv.edge_blk_num, self.cenv.edge_blk_num, 3))
-        real_obs = np.zeros((7*self.cenv.edge_blk_num, 7*self.cenv.edge_blk_num, 3))
-        for i in range(self.N_agent):
-            agt_pos = self.get_agent_pos(i)
-            agt_pos = self.real_pos_to_img_pos(agt_pos)
-            if i % 2 == 0:
-                obs[agt_pos[0], agt_pos[1], 0] = 1
-                obs[agt_pos[0], agt_pos[1], 1] = 0
-                obs[agt_pos[0], agt_pos[1], 2] = 0
-            else:
-                obs[agt_pos[0], agt_pos[1], 0] = 0
-                obs[agt_pos[0], agt_pos[1], 1] = 0
-                obs[agt_pos[0], agt_pos[1], 2] = 1
-        for i in range(self.cenv.edge_blk_num):
-            for j in range(self.cenv.edge_blk_num):
-                for k in range(7):
-                    for l in range(7):
-                        real_obs[7*i+k, 7*j+l, 0] = obs[i, j, 0]
-                        real_obs[7 * i + k, 7 * j + l, 1] = obs[i, j, 1]
-                        real_obs[7 * i + k, 7 * j + l, 2] = obs[i, j, 2]
-        return real_obs
+        # global obs with every block drawn 7x7
+        return self.get_global_obs().repeat(7, axis=0).repeat(7, axis=1)
 
     def real_pos_to_img_pos(self, pos):
         half_view_range = 2
@@ -129,12 +93,22 @@ class EnvRescue(object):
 
     def reset(self):
         self.cenv.reset()
+        self.rescued_num = self.get_rescued_human_num()
 
     def get_agent_pos(self, agt_id):
         self.cenv.get_agt_x(agt_id)
         self.cenv.get_agt_y(agt_id)
         return [self.cenv.x, self.cenv.y]
 
+    def get_all_agent_pos(self):
+        this = self.cenv.this
+        pos = []
+        for i in range(self.N_agent):
+            _CEnvRescue.CEnvRescue_get_agt_x(this, i)
+            _CEnvRescue.CEnvRescue_get_agt_y(this, i)
+            pos.append((_CEnvRescue.CEnvRescue_x_get(this), _CEnvRescue.CEnvRescue_y_get(this)))
+        return np.array(pos)
+
     def get_agent_last_pos(self, agt_id):
         self.cenv.get_agt_last_x(agt_id)
         self.cenv.get_agt_last_y(agt_id)
@@ -0,0 +1,87 @@
+import ctypes
+import numpy as np
+import _CEnvRescue
+
+# the extension only hands observations out one double per call, this reads the std::vector<double>
+# buffers they are stored in directly; libstdc++ lays a vector out as its begin, end and capacity pointers
+
+
+def vector_data(address):
+    # (pointer to the first double, number of doubles) of the vector at address
+    begin, end, capacity = (ctypes.c_size_t * 3).from_address(address)
+    return begin, (end - begin) // 8
+
+
+def vector_view(address):
+    begin, n = vector_data(address)
+    if n <= 0:
+        return np.zeros(0)
+    return np.ctypeslib.as_array((ctypes.c_double * n).from_address(begin))
+
+
+class ObsReader(object):
+    def __init__(self, cenv):
+        self.cenv = cenv
+        self.this = cenv.this
+        self.agent_obs_offset = None  # where in a CAgent its obs vector sits, found on the first agent obs read
+        self.bulk_global = None
+        self.bulk_agent = None
+
+    def read_elements(self, get, value, args, n):
+        # the per-element path, one binding round trip per double
+        get_raw = getattr(_CEnvRescue, 'CEnvRescue_' + get)
+        value_raw = getattr(_CEnvRescue, 'CEnvRescue_' + value + '_get')
+        values = []
+        for i in range(n):
+            get_raw(self.this, *(args + (i,)))
+            values.append(value_raw(self.this))
+        return np.array(values)
+
+    def global_obs(self, out):
+        # out: (edge_blk_num, edge_blk_num, 3), filled with the map part of the global obs
+        self.cenv.init_global_obs()
+        if self.bulk_global is None:
+            # trust the raw buffer only if it holds exactly what the per-element calls return,
+            # an all zero obs could match any buffer so the check waits for one with content
+            reference = self.read_elements('get_global_obs', 'global_obs', (), out.size)
+            view = vector_view(int(self.cenv.global_obs_list))
+            if reference.any():
+                self.bulk_global = view.shape == reference.shape and np.array_equal(view, reference)
+            out[...] = reference.reshape(out.shape)
+        elif self.bulk_global:
+            out[...] = vector_view(int(self.cenv.global_obs_list)).reshape(out.shape)
+        else:
+            out[...] = self.read_elements('get_global_obs', 'global_obs', (), out.size).reshape(out.shape)
+        return out
+
+    def agent_obs(self, agt_id, out):
+        # out: (obs_size, obs_size, 3), filled with the obs of agent agt_id
+        self.cenv.init_obs(agt_id)
+        if self.bulk_agent is None:
+            reference = self.read_elements('get_obs', 'obs', (agt_id,), out.size)
+            if reference.any():
+                self.bulk_agent = self.find_agent_obs(agt_id, reference)
+            out[...] = reference.reshape(out.shape)
+        elif self.bulk_agent:
+            out[...] = vector_view(self.agent_address(agt_id) + self.agent_obs_offset).reshape(out.shape)
+        else:
+            out[...] = self.read_elements('get_obs', 'obs', (agt_id,), out.size).reshape(out.shape)
+        return out
+
+    def agent_address(self, agt_id):
+        begin, end, capacity = (ctypes.c_size_t * 3).from_address(int(self.cenv.agent_list))
+        return begin + agt_id * ((end - begin) // self.cenv.N_agent)
+
+    def find_agent_obs(self, agt_id, reference):
+        # look through the CAgent for a vector of the obs length whose data matches the per-element read
+        start, end, capacity = (ctypes.c_size_t * 3).from_address(int(self.cenv.agent_list))
+        agent_size = (end - start) // self.cenv.N_agent
+        address = self.agent_address(agt_id)
+        words = (ctypes.c_size_t * (agent_size // 8)).from_address(address)
+        for i in range(agent_size // 8 - 2):
+            begin, end, capacity = words[i], words[i + 1], words[i + 2]
+            if begin and begin % 8 == 0 and end - begin == 8 * reference.size and capacity >= end:
+                if np.array_equal(vector_view(address + 8 * i), reference):
+                    self.agent_obs_offset = 8 * i
+                    return True
+        return False
@@ -1,8 +1,8 @@
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
 import random
-import cv2
+
+HEADLESS = os.environ.get('MAENV_HEADLESS', '0') != '0'
 
 class EnvSingleCatchPigs(object):
 
@@ -455,6 +455,10 @@ class EnvSingleCatchPigs(object):
         return reward_1, done
 
     def plot_scene(self):
+        if HEADLESS:
+            return
+        import matplotlib.pyplot as plt
+        from matplotlib.gridspec import GridSpec
         fig = plt.figure(figsize=(5, 5))
         gs = GridSpec(3, 3, figure=fig)
         ax1 = fig.add_subplot(gs[0:2, 0:3])
@@ -480,6 +484,9 @@ class EnvSingleCatchPigs(object):
             self.pig_ori = tgt_ori
 
     def render(self):
+        if HEADLESS:
+            return
+        import cv2
         obs = np.ones((self.map_size*21, self.map_size*21, 3))
         for i in range(self.map_size):
             for j in range(self.map_size):
@@ -1,8 +1,8 @@
+import os
 import numpy as np
 import random
-import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
-import cv2
+
+HEADLESS = os.environ.get('MAENV_HEADLESS', '0') != '0'
 
 class Box(object):
     def __init__(self, pos, size, id):
@@ -395,6 +395,10 @@ class EnvWarehouse(object):
         return obs
 
     def plot_scene(self):
+        if HEADLESS:
+            return
+        import matplotlib.pyplot as plt
+        from matplotlib.gridspec import GridSpec
         fig = plt.figure(figsize=(5, 5))
         gs = GridSpec(2, 1, figure=fig)
         ax1 = fig.add_subplot(gs[0, 0])
@@ -408,6 +412,9 @@ class EnvWarehouse(object):
         plt.show()
 
     def render(self):
+        if HEADLESS:
+            return
+        import cv2
         obs = np.ones((13 * 20, 17 * 20, 3))
         for i in range(13):
             for j in range(17):
@@ -0,0 +1,133 @@
+import multiprocessing as mp
+import random
+import numpy as np
+
+
+def default_obs(env):
+    # per-agent obs list if the env has one, otherwise the global obs
+    if hasattr(env, 'get_obs'):
+        return np.asarray(env.get_obs(), dtype=np.float32)
+    return np.asarray(env.get_global_obs(), dtype=np.float32)
+
+
+def default_step(env, actions):
+    # every env takes one action list, some return only the reward
+    out = env.step(list(actions))
+    if isinstance(out, tuple):
+        return out
+    return out, False
+
+
+def default_reset(env):
+    env.reset()
+
+
+def shared_array(ctx, shape, dtype):
+    # numpy view on a lock-free shared buffer, inherited by the workers
+    dtype = np.dtype(dtype)
+    raw = ctx.RawArray('b', int(np.prod(shape)) * dtype.itemsize)
+    return raw, np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def worker(remote, parent_remote, env_fn, env_ids, seed, obs_fn, step_fn, reset_fn, auto_reset, buffers):
+    parent_remote.close()
+    # forked workers inherit the parent's random state, give each its own stream
+    random.seed(seed + env_ids[0])
+    np.random.seed(seed + env_ids[0])
+    obs, actions, rewards, dones = [np.frombuffer(raw, dtype=dtype).reshape(shape) for raw, dtype, shape in buffers]
+    envs = [env_fn() for _ in env_ids]
+    try:
+        while True:
+            cmd = remote.recv()
+            if cmd == 'step':
+                for i, env in zip(env_ids, envs):
+                    reward, done = step_fn(env, actions[i])
+                    rewards[i] = reward
+                    dones[i] = done
+                    if done and auto_reset:
+                        reset_fn(env)
+                    obs[i] = obs_fn(env)
+            elif cmd == 'reset':
+                for i, env in zip(env_ids, envs):
+                    reset_fn(env)
+                    obs[i] = obs_fn(env)
+            elif cmd == 'close':
+                break
+            remote.send(True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        remote.close()
+
+
+class SubprocVecEnv(object):
+    def __init__(self, env_fn, n_envs, n_agents, n_workers=None, seed=0, obs_fn=default_obs, step_fn=default_step,
+                 reset_fn=default_reset, auto_reset=True):
+        # n_envs copies of env_fn() spread over n_workers processes, each worker steps its envs in turn
+        # actions go in and obs / rewards / dones come back through shared memory, the pipes only carry commands
+        # env_fn, obs_fn, step_fn and reset_fn must be picklable when the start method is not fork
+        self.n_envs = n_envs
+        self.n_agents = n_agents
+        self.n_workers = min(n_workers or mp.cpu_count(), n_envs)
+
+        # one probe env in this process fixes the obs and reward shapes
+        probe = env_fn()
+        reset_fn(probe)
+        obs_shape = np.shape(obs_fn(probe))
+        reward_shape = np.shape(step_fn(probe, np.zeros(n_agents, dtype=np.int64))[0])
+        del probe
+
+        ctx = mp.get_context()
+        specs = [((n_envs,) + obs_shape, np.float32), ((n_envs, n_agents), np.int64),
+                 ((n_envs,) + reward_shape, np.float32), ((n_envs,), np.bool_)]
+        buffers = []
+        views = []
+        for shape, dtype in specs:
+            raw, view = shared_array(ctx, shape, dtype)
+            buffers.append((raw, dtype, shape))
+            views.append(view)
+        self.obs, self.actions, self.rewards, self.dones = views
+
+        self.remotes, self.processes = [], []
+        for env_ids in np.array_split(np.arange(n_envs), self.n_workers):
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(target=worker, args=(work_remote, remote, env_fn, env_ids.tolist(), seed, obs_fn,
+                                                       step_fn, reset_fn, auto_reset, buffers), daemon=True)
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+        self.closed = False
+
+    def _run(self, cmd):
+        for remote in self.remotes:
+            remote.send(cmd)
+        for remote in self.remotes:
+            remote.recv()
+
+    def reset(self):
+        # the returned arrays are the shared buffers themselves, copy them to keep them past the next call
+        self._run('reset')
+        return self.obs
+
+    def step(self, actions):
+        # actions: (n_envs, n_agents) ints, returns (obs, rewards, dones) with a leading n_envs axis
+        # finished envs are reset right away when auto_reset is on, obs then holds the first obs of the next episode
+        self.actions[...] = actions
+        self._run('step')
+        return self.obs, self.rewards, self.dones
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send('close')
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
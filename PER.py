@@ -0,0 +1,93 @@
+import numpy as np
+
+
+class SumTree():
+    def __init__(self, capacity):
+        # perfect binary tree in one array: node 1 is the root, node i has children 2i and 2i+1,
+        # the leaves n_leaves..2*n_leaves-1 hold the priorities and every inner node the sum below it
+        self.capacity = capacity
+        self.depth = max(int(np.ceil(np.log2(capacity))), 1)
+        self.n_leaves = 1 << self.depth
+        self.tree = np.zeros(2 * self.n_leaves)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, idx):
+        return self.tree[np.asarray(idx) + self.n_leaves]
+
+    def update(self, idx, priority):
+        # set a batch of leaves and refresh their ancestors level by level, O(batch * log n)
+        node = np.asarray(idx) + self.n_leaves
+        self.tree[node] = priority
+        for _ in range(self.depth):
+            node = node >> 1
+            self.tree[node] = self.tree[2 * node] + self.tree[2 * node + 1]
+
+    def find(self, value):
+        # leaf whose prefix-sum interval contains each value, one vectorized descent for the whole batch
+        value = np.array(value, dtype=np.float64)
+        node = np.ones(len(value), dtype=np.int64)
+        for _ in range(self.depth):
+            left = self.tree[2 * node]
+            go_right = value >= left
+            value -= left * go_right
+            node = 2 * node + go_right
+        return node - self.n_leaves
+
+
+class prioritized_replay_buffer():
+    def __init__(self, buffer_len, batch_size, state_shape=(3, 3, 3), action_shape=(5,), action_dtype=np.float32,
+                 alpha=0.6, beta=0.4, beta_increment=1e-4, eps=1e-6):
+        # same columns as DQN.replay_buffer, sampled in proportion to priority = (|td_error| + eps) ^ alpha
+        self.buffer_len = buffer_len
+        self.batch_size = batch_size
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+        self.max_priority = 1.0
+        self.tree = SumTree(buffer_len)
+        self.states = np.zeros((buffer_len,) + tuple(state_shape), dtype=np.float32)
+        self.actions = np.zeros((buffer_len,) + tuple(action_shape), dtype=action_dtype)
+        self.rewards = np.zeros((buffer_len, 1), dtype=np.float32)
+        self.new_states = np.zeros((buffer_len,) + tuple(state_shape), dtype=np.float32)
+        self.dones = np.zeros((buffer_len, 1), dtype=np.float32)
+        self.index = 0
+        self.size = 0
+        self.rng = np.random.default_rng()
+
+    def __len__(self):
+        return self.size
+
+    def transfrom_store(self, state, action, reward, new_state, done):
+        # new transitions get the highest priority seen so far so each is replayed at least once
+        i = self.index
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.new_states[i] = new_state
+        self.dones[i] = done
+        self.tree.update([i], self.max_priority)
+        self.index = (i + 1) % self.buffer_len
+        self.size = min(self.size + 1, self.buffer_len)
+
+    def sample(self):
+        # (s, a, r, s_, done, weights, idx), -1 while fewer than batch_size are stored
+        # one value per equal slice of the total priority, weights are normalized importance-sampling weights
+        if self.size < self.batch_size:
+            return -1
+        segment = self.tree.total() / self.batch_size
+        value = (np.arange(self.batch_size) + self.rng.random(self.batch_size)) * segment
+        idx = np.minimum(self.tree.find(value), self.size - 1)
+        prob = self.tree.get(idx) / self.tree.total()
+        weights = (self.size * prob) ** -self.beta
+        weights = (weights / weights.max()).astype(np.float32).reshape(-1, 1)
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return (self.states[idx], self.actions[idx], self.rewards[idx], self.new_states[idx], self.dones[idx],
+                weights, idx)
+
+    def update_priorities(self, idx, td_error):
+        priority = (np.abs(np.asarray(td_error, dtype=np.float64).reshape(-1)) + self.eps) ** self.alpha
+        self.tree.update(idx, priority)
+        self.max_priority = max(self.max_priority, priority.max())
@@ -0,0 +1,159 @@
+import time
+import numpy as np
+
+
+class shared_replay_buffer():
+    def __init__(self, ctx, buffer_len, batch_size, state_shape=(3, 3, 3), action_shape=(5,), action_dtype=np.float32):
+        # same columns and interface as DQN.replay_buffer, but in shared memory so actor processes can write into it
+        # one lock guards the ring index and the rows being written or copied out
+        self.buffer_len = buffer_len
+        self.batch_size = batch_size
+        self.specs = dict(states=((buffer_len,) + tuple(state_shape), np.float32),
+                          actions=((buffer_len,) + tuple(action_shape), action_dtype),
+                          rewards=((buffer_len, 1), np.float32),
+                          new_states=((buffer_len,) + tuple(state_shape), np.float32),
+                          dones=((buffer_len, 1), np.float32))
+        self.raw = {name: ctx.RawArray('b', int(np.prod(shape)) * np.dtype(dtype).itemsize)
+                    for name, (shape, dtype) in self.specs.items()}
+        self.counters = ctx.RawArray('q', 3)  # write index, size, total stored
+        self.lock = ctx.Lock()
+        self.attach()
+
+    def attach(self):
+        for name, (shape, dtype) in self.specs.items():
+            setattr(self, name, np.frombuffer(self.raw[name], dtype=dtype).reshape(shape))
+        self.rng = np.random.default_rng()
+
+    def __getstate__(self):
+        # numpy views are rebuilt on the other side from the shared buffers
+        state = self.__dict__.copy()
+        for name in list(self.specs) + ['rng']:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.attach()
+
+    def __len__(self):
+        return self.counters[1]
+
+    def total_stored(self):
+        return self.counters[2]
+
+    def transfrom_store(self, state, action, reward, new_state, done):
+        with self.lock:
+            i = self.counters[0]
+            self.states[i] = state
+            self.actions[i] = action
+            self.rewards[i] = reward
+            self.new_states[i] = new_state
+            self.dones[i] = done
+            self.counters[0] = (i + 1) % self.buffer_len
+            self.counters[1] = min(self.counters[1] + 1, self.buffer_len)
+            self.counters[2] += 1
+
+    def sample(self):
+        # (s, a, r, s_, done) batches drawn without replacement, -1 while fewer than batch_size are stored
+        size = len(self)
+        if size < self.batch_size:
+            return -1
+        idx = self.rng.choice(size, self.batch_size, replace=False)
+        with self.lock:
+            return self.states[idx], self.actions[idx], self.rewards[idx], self.new_states[idx], self.dones[idx]
+
+
+class weight_snapshot():
+    def __init__(self, ctx, weights):
+        # flat float32 copy of a list of weight arrays plus a version counter used as a seqlock:
+        # the counter is odd while the learner is writing, readers retry if it moved while they copied
+        self.shapes = [np.shape(w) for w in weights]
+        self.sizes = [int(np.prod(s)) for s in self.shapes]
+        self.raw = ctx.RawArray('f', sum(self.sizes))
+        self.sequence = ctx.RawValue('q', 0)
+
+    def version(self):
+        return self.sequence.value // 2
+
+    def publish(self, weights):
+        flat = np.frombuffer(self.raw, dtype=np.float32)
+        self.sequence.value += 1
+        offset = 0
+        for w, n in zip(weights, self.sizes):
+            flat[offset:offset + n] = np.ravel(w)
+            offset += n
+        self.sequence.value += 1
+        return self.version()
+
+    def read(self, last_version=-1):
+        # (version, list of arrays), the list is None when nothing newer than last_version was published
+        flat = np.frombuffer(self.raw, dtype=np.float32)
+        while True:
+            sequence = self.sequence.value
+            if sequence % 2:
+                time.sleep(0)
+                continue
+            if sequence // 2 == last_version:
+                return last_version, None
+            data = flat.copy()
+            if self.sequence.value == sequence:
+                break
+        weights, offset = [], 0
+        for shape, n in zip(self.shapes, self.sizes):
+            weights.append(data[offset:offset + n].reshape(shape))
+            offset += n
+        return sequence // 2, weights
+
+
+class async_stats():
+    def __init__(self, ctx, n_actors):
+        # counters written by each side and read by the learner's log
+        self.n_actors = n_actors
+        self.actor_steps = ctx.RawArray('q', n_actors)
+        self.actor_versions = ctx.RawArray('q', n_actors)  # snapshot version each actor is acting with
+        self.learner_updates = ctx.RawValue('q', 0)
+        self.learner_version = ctx.RawValue('q', 0)
+        self.stop = ctx.RawValue('b', 0)
+        self.start = time.time()
+
+    def report(self, replay=None):
+        elapsed = max(time.time() - self.start, 1e-9)
+        actor_steps = np.array(self.actor_steps[:])
+        lag = self.learner_version.value - np.array(self.actor_versions[:])
+        report = dict(actor_steps_per_sec=float(actor_steps.sum() / elapsed),
+                      learner_updates_per_sec=self.learner_updates.value / elapsed,
+                      mean_policy_lag=float(lag.mean()), max_policy_lag=int(lag.max()),
+                      learner_version=self.learner_version.value)
+        if replay is not None:
+            # transitions per gradient step, how far the learner is behind the actors
+            report['replay_ratio'] = replay.total_stored() / max(self.learner_updates.value, 1)
+        return report
+
+
+def run_learner(ctx, actor_fn, actor_args, n_actors, learn, get_weights, snapshot, replay, stats, n_updates,
+                publish_every=20, log_every=5.0):
+    # actors run actor_fn(actor_id, snapshot, replay, stats, *actor_args) until stats.stop is set,
+    # this process keeps training on whatever is in the shared replay and publishes the weights every publish_every updates
+    stats.learner_version.value = snapshot.publish(get_weights())
+    processes = [ctx.Process(target=actor_fn, args=(i, snapshot, replay, stats) + tuple(actor_args), daemon=True)
+                 for i in range(n_actors)]
+    for process in processes:
+        process.start()
+    last_log = time.time()
+    try:
+        while stats.learner_updates.value < n_updates:
+            if len(replay) < replay.batch_size:
+                time.sleep(0.01)
+                continue
+            learn()
+            stats.learner_updates.value += 1
+            if stats.learner_updates.value % publish_every == 0:
+                stats.learner_version.value = snapshot.publish(get_weights())
+            if time.time() - last_log > log_every:
+                print(stats.report(replay))
+                last_log = time.time()
+    finally:
+        stats.stop.value = 1
+        for process in processes:
+            process.join()
+    return stats.report(replay)